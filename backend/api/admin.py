@@ -41,7 +41,7 @@ class IngredientsInRecipeInline(admin.TabularInline):
 
 class RecipeAdmin(admin.ModelAdmin):
     form = RecipeForm
-    list_display = ('name', 'author', 'get_favorite_count')
+    list_display = ('name', 'author', 'get_favorite_count', 'in_carts_count')
     search_fields = ('name', 'author__username')
     list_filter = ('tags',)
     inlines = [IngredientsInRecipeInline, TagRecipeInline]
@@ -90,10 +90,14 @@ class RecipeAdmin(admin.ModelAdmin):
             form.add_error(None, e)
             raise
 
+        Recipe.objects.filter(id=form.instance.id).recount(
+            'ingredients_count')
+
     def get_favorite_count(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
 
     get_favorite_count.short_description = 'Количество добавлений в избранное'
+    get_favorite_count.admin_order_field = 'favorites_count'
 
 
 class IngredientAdmin(admin.ModelAdmin):
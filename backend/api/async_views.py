@@ -0,0 +1,98 @@
+"""Async-версии горячих эндпоинтов чтения для ASGI.
+
+В Django 3.2 нет асинхронного ORM, поэтому всё, что ходит в базу,
+выполняется в пуле потоков через sync_to_async(thread_sensitive=False):
+иначе все синхронные вызовы одного процесса шли бы в один поток.
+Анонимные ответы из кэша и короткие ссылки из LRU отдаются без
+обращения к базе.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse
+from django.urls import resolve
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+from .cache import build_key, get_cache, get_etag, set_validators
+from .shortlinks import redirect_response, resolver
+
+FALLBACK_URLCONF = 'backend.urls'
+
+
+def in_thread_pool(func):
+    """Запуск синхронной функции в пуле потоков со своим соединением."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(wrapper, thread_sensitive=False)
+
+
+def call_sync_view(request):
+    """Обычная обработка запроса синхронной вьюхой из backend.urls."""
+    match = resolve(request.path_info, urlconf=FALLBACK_URLCONF)
+    response = match.func(request, *match.args, **match.kwargs)
+    if hasattr(response, 'render'):
+        response.render()
+    return response
+
+
+def is_cacheable(request):
+    return (settings.API_CACHE_ENABLED
+            and request.method == 'GET'
+            and 'HTTP_AUTHORIZATION' not in request.META
+            and 'text/html' not in request.META.get('HTTP_ACCEPT', ''))
+
+
+def cached_read(viewset, action):
+    """Async-вьюха: анонимный ответ из кэша, остальное — в пуле потоков."""
+    def cached_response(request, kwargs):
+        view = viewset(action=action, kwargs=kwargs, request=request)
+        generations, last_modified = view.get_cache_state()
+        key = build_key(request, view.get_cache_groups(), generations)
+        etag = response = None
+        if view.use_validators():
+            etag = get_etag(key, None, 'application/json')
+            response = get_conditional_response(request, etag=etag)
+        if response is None:
+            data = get_cache().get(key)
+            if data is None:
+                return None
+            response = HttpResponse(JSONRenderer().render(data),
+                                    content_type='application/json')
+        patch_vary_headers(response, ('Accept',))
+        if etag:
+            set_validators(response, etag, last_modified,
+                           view.personalized, False)
+        return response
+
+    async def view(request, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await sync_to_async(call_sync_view)(request)
+        if is_cacheable(request):
+            response = await sync_to_async(
+                cached_response, thread_sensitive=False)(request, kwargs)
+            if response is not None:
+                return response
+        return await in_thread_pool(call_sync_view)(request)
+
+    # Как у вьюх DRF: CSRF для сессий проверяет SessionAuthentication.
+    # Декоратор csrf_exempt в Django 3.2 превратил бы вьюху в синхронную.
+    view.csrf_exempt = True
+    return view
+
+
+async def short_link_redirect(request, short_link):
+    recipe_path = resolver.cached(short_link)
+    if recipe_path is None:
+        recipe_path = await in_thread_pool(resolver.resolve)(short_link)
+    if recipe_path is None:
+        raise Http404
+    return redirect_response(recipe_path)
@@ -0,0 +1,393 @@
+import base64
+import io
+import json
+import random
+import statistics
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .management.base import read_csv
+from .user_lists import add_recipes
+from .models import (Favorite, Ingredient, IngredientsInRecipe, Recipe,
+                     ShortLink, Tag, TagRecipe, UserRecipe)
+from users.models import Subscription, User
+
+INGREDIENTS_CSV = settings.BASE_DIR.parent / 'data' / 'ingredients.csv'
+
+
+def seed(users=50, recipes=200, ingredients_per_recipe=8, tags=5,
+         favorites=10, subscriptions=5, seed_value=0):
+    """Заполняет базу синтетическими данными заданного размера."""
+    rnd = random.Random(seed_value)
+    if Path(INGREDIENTS_CSV).exists():
+        rows = read_csv(INGREDIENTS_CSV, ('name', 'measurement_unit'))
+    else:
+        rows = ({'name': f'ингредиент {number}', 'measurement_unit': 'г'}
+                for number in range(2000))
+    Ingredient.objects.bulk_create([Ingredient(**row) for row in rows],
+                                   ignore_conflicts=True)
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+    Tag.objects.bulk_create([
+        Tag(name=f'Тег {number}', slug=f'tag{number}')
+        for number in range(tags)
+    ], ignore_conflicts=True)
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+    User.objects.bulk_create([
+        User(email=f'bench{number}@example.com',
+             username=f'bench{number}',
+             first_name='Bench', last_name=str(number))
+        for number in range(users)
+    ])
+    user_ids = list(User.objects.filter(
+        username__startswith='bench').values_list('id', flat=True))
+    Recipe.objects.bulk_create([
+        Recipe(author_id=rnd.choice(user_ids), name=f'Рецепт {number}',
+               text='Описание ' * 20, cooking_time=rnd.randint(1, 120),
+               image=f'recipes/bench{number}.png')
+        for number in range(recipes)
+    ])
+    recipe_ids = list(Recipe.objects.filter(
+        name__startswith='Рецепт ').values_list('id', flat=True))
+    IngredientsInRecipe.objects.bulk_create([
+        IngredientsInRecipe(recipe_id=recipe_id, ingredients_id=ingredient,
+                            amount=rnd.randint(1, 500))
+        for recipe_id in recipe_ids
+        for ingredient in rnd.sample(ingredient_ids,
+                                     min(ingredients_per_recipe,
+                                         len(ingredient_ids)))
+    ], batch_size=1000)
+    TagRecipe.objects.bulk_create([
+        TagRecipe(recipe_id=recipe_id, tag_id=tag)
+        for recipe_id in recipe_ids
+        for tag in rnd.sample(tag_ids, min(2, len(tag_ids)))
+    ], batch_size=1000)
+    ShortLink.objects.allocate(Recipe.objects.filter(id__in=recipe_ids),
+                               batch_size=1000)
+    for model, per_user in ((Favorite, favorites), (UserRecipe, favorites)):
+        model.objects.bulk_create([
+            model(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in rnd.sample(recipe_ids,
+                                        min(per_user, len(recipe_ids)))
+        ], batch_size=1000, ignore_conflicts=True)
+    Subscription.objects.bulk_create([
+        Subscription(user_id=user_id, subscribed_to_id=author_id)
+        for user_id in user_ids
+        for author_id in rnd.sample(user_ids,
+                                    min(subscriptions, len(user_ids)))
+        if author_id != user_id
+    ], batch_size=1000, ignore_conflicts=True)
+    Recipe.objects.recount('favorites_count')
+    Recipe.objects.recount('in_carts_count')
+    Recipe.objects.recount('ingredients_count')
+    return user_ids
+
+
+def image_content():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), 'orange').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def image_payload():
+    return ('data:image/png;base64,'
+            + base64.b64encode(image_content()).decode())
+
+
+class Scenario:
+    """Запрос сценария; url и data могут быть функциями от прогона.
+
+    auth=False — анонимный клиент, staff=True — администратор.
+    """
+
+    def __init__(self, name, method, url, data=None, auth=True,
+                 setup=None, staff=False, content_type=None):
+        self.name = name
+        self.method = method
+        self.url = url
+        self.data = data
+        self.auth = auth
+        self.setup = setup
+        self.staff = staff
+        self.content_type = content_type
+
+
+def build_scenarios(user):
+    """Сценарии для маршрутов api/urls.py и редиректа коротких ссылок.
+
+    Маршруты djoser под auth/ (регистрация, токены) не замеряются.
+    """
+    recipe = Recipe.objects.exclude(author=user).order_by('id').first()
+    own = Recipe.objects.filter(author=user).order_by('id').first()
+    author = recipe.author
+    tag, other_tag, *_, last_tag = Tag.objects.order_by('id')
+    ingredient = Ingredient.objects.order_by('id').first()
+    short_link = ShortLink.objects.get(recipe=recipe).short_url
+    ingredient_ids = list(Ingredient.objects.order_by('id').values_list(
+        'id', flat=True)[:5])
+    recipe_ids = list(Recipe.objects.order_by('-id').values_list(
+        'id', flat=True)[:20])
+    counter = iter(range(10 ** 9))
+
+    def changed_amount():
+        data = new_recipe()
+        data['ingredients'][0]['amount'] = 10 + next(counter) % 2
+        return data
+
+    def new_recipe():
+        return {
+            'name': f'Новый рецепт {next(counter)}',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': image_payload(),
+            'tags': [tag.id],
+            'ingredients': [{'id': pk, 'amount': 10}
+                            for pk in ingredient_ids],
+        }
+
+    def cleanup_relations():
+        Favorite.objects.filter(user=user, recipe=recipe).delete()
+        UserRecipe.objects.filter(user=user, recipe=recipe).delete()
+        Subscription.objects.filter(user=user, subscribed_to=author).delete()
+
+    def add_relations():
+        add_recipes('favorite', user, [recipe.id, *recipe_ids])
+        add_recipes('shopping_cart', user, [recipe.id, *recipe_ids])
+        Subscription.objects.get_or_create(user=user, subscribed_to=author)
+
+    def import_rows():
+        return json.dumps({
+            'name': f'Загруженный рецепт {next(counter)}',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': image_payload(),
+            'tags': [tag.slug],
+            'ingredients': [{'name': ingredient.name, 'amount': 10}],
+        }, ensure_ascii=False) + '\n'
+
+    def add_disposable_recipe():
+        disposable = Recipe.objects.create(
+            author=user, name=f'Удаляемый рецепт {next(counter)}',
+            text='Описание', cooking_time=10, image=own.image.name,
+            # Картинка уже обработана: своих версий у копии нет.
+            image_variants={'source': own.image.name})
+        IngredientsInRecipe.objects.bulk_create([
+            IngredientsInRecipe(recipe=disposable, ingredients_id=pk,
+                                amount=10)
+            for pk in ingredient_ids])
+        TagRecipe.objects.create(recipe=disposable, tag=tag)
+
+    def disposable_url():
+        disposable = Recipe.objects.filter(
+            author=user, name__startswith='Удаляемый').latest('id')
+        return f'/api/recipes/{disposable.id}/'
+
+    def add_avatar():
+        User.objects.filter(id=user.id).update(avatar=default_storage.save(
+            'avatars/benchmark.png', ContentFile(image_content())))
+
+    return [
+        Scenario('users-list', 'get', '/api/users/', staff=True),
+        Scenario('users-detail', 'get', f'/api/users/{author.id}/'),
+        Scenario('users-me', 'get', '/api/users/me/'),
+        Scenario('users-subscriptions', 'get',
+                 '/api/users/subscriptions/?recipes_limit=3'),
+        Scenario('users-subscribe', 'post',
+                 f'/api/users/{author.id}/subscribe/',
+                 setup=cleanup_relations),
+        Scenario('users-unsubscribe', 'delete',
+                 f'/api/users/{author.id}/subscribe/', setup=add_relations),
+        Scenario('users-avatar', 'put', '/api/users/me/avatar/',
+                 data=lambda: {'avatar': image_payload()}),
+        Scenario('users-avatar-delete', 'delete', '/api/users/me/avatar/',
+                 setup=add_avatar),
+        Scenario('tags-list', 'get', '/api/tags/', auth=False),
+        Scenario('tags-detail', 'get', f'/api/tags/{tag.id}/', auth=False),
+        Scenario('ingredients-search', 'get',
+                 '/api/ingredients/?name=' + ingredient.name[:3],
+                 auth=False),
+        Scenario('ingredients-detail', 'get',
+                 f'/api/ingredients/{ingredient.id}/', auth=False),
+        Scenario('recipes-list-anonymous', 'get', '/api/recipes/',
+                 auth=False),
+        Scenario('recipes-list', 'get', '/api/recipes/'),
+        Scenario('recipes-list-tags', 'get',
+                 f'/api/recipes/?tags={tag.slug}'),
+        Scenario('recipes-list-tags-all', 'get',
+                 f'/api/recipes/?tags={tag.slug}&tags={last_tag.slug}'
+                 f'&tags_match=all&exclude_tags={other_tag.slug}'),
+        Scenario('recipes-list-compact', 'get',
+                 '/api/recipes/?fields=name,image,cooking_time,author,tags'),
+        Scenario('recipes-list-favorited', 'get',
+                 '/api/recipes/?is_favorited=1'),
+        Scenario('recipes-list-cursor', 'get', '/api/recipes/?cursor='),
+        Scenario('recipes-detail', 'get', f'/api/recipes/{recipe.id}/'),
+        Scenario('recipes-can-cook', 'get',
+                 '/api/recipes/can_cook/?ingredients='
+                 + ','.join(map(str, ingredient_ids))),
+        Scenario('recipes-create', 'post', '/api/recipes/',
+                 data=new_recipe),
+        Scenario('recipes-update', 'patch', f'/api/recipes/{own.id}/',
+                 data=new_recipe),
+        Scenario('recipes-update-amount', 'patch',
+                 f'/api/recipes/{own.id}/', data=changed_amount),
+        Scenario('recipes-delete', 'delete', disposable_url,
+                 setup=add_disposable_recipe),
+        Scenario('recipes-export', 'get', '/api/recipes/export/?type=ndjson'),
+        Scenario('recipes-import', 'post', '/api/recipes/import/?type=ndjson',
+                 data=import_rows, content_type='application/x-ndjson'),
+        Scenario('recipes-download', 'get',
+                 '/api/recipes/download_shopping_cart/'),
+        Scenario('recipes-favorite', 'post',
+                 f'/api/recipes/{recipe.id}/favorite/',
+                 setup=cleanup_relations),
+        Scenario('recipes-shopping-cart', 'post',
+                 f'/api/recipes/{recipe.id}/shopping_cart/',
+                 setup=cleanup_relations),
+        Scenario('recipes-favorite-delete', 'delete',
+                 f'/api/recipes/{recipe.id}/favorite/', setup=add_relations),
+        Scenario('recipes-shopping-cart-delete', 'delete',
+                 f'/api/recipes/{recipe.id}/shopping_cart/',
+                 setup=add_relations),
+        Scenario('recipes-favorite-batch', 'post',
+                 '/api/recipes/favorite/batch/',
+                 data={'recipes': recipe_ids}),
+        Scenario('recipes-favorite-batch-delete', 'delete',
+                 '/api/recipes/favorite/batch/',
+                 data={'recipes': recipe_ids}, setup=add_relations),
+        Scenario('recipes-shopping-cart-batch', 'post',
+                 '/api/recipes/shopping_cart/batch/',
+                 data={'recipes': recipe_ids}),
+        Scenario('recipes-shopping-cart-batch-delete', 'delete',
+                 '/api/recipes/shopping_cart/batch/',
+                 data={'recipes': recipe_ids}, setup=add_relations),
+        Scenario('recipes-get-link', 'get',
+                 f'/api/recipes/{recipe.id}/get-link/'),
+        Scenario('short-link-redirect', 'get', f'/s/{short_link}/',
+                 auth=False),
+        Scenario('short-links-stats', 'get', '/api/short-links/stats/',
+                 staff=True),
+    ]
+
+
+class RowsWritten:
+    """Считает строки, изменённые INSERT/UPDATE/DELETE."""
+
+    WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+    def __init__(self):
+        self.rows = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        if sql.lstrip().upper().startswith(self.WRITES):
+            self.rows += max(context['cursor'].rowcount, 0)
+        return result
+
+
+TRANSACTION_CONTROL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+
+def count_queries(captured):
+    """Запросы без управления транзакцией: их число зависит от СУБД."""
+    return sum(
+        not query['sql'].lstrip().upper().startswith(TRANSACTION_CONTROL)
+        for query in captured)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_scenario(scenario, client, repeat):
+    queries, timings, sizes, statuses = [], [], set(), set()
+    rows_written = []
+    for _ in range(repeat):
+        if scenario.setup:
+            scenario.setup()
+        data = scenario.data() if callable(scenario.data) else scenario.data
+        url = scenario.url() if callable(scenario.url) else scenario.url
+        if scenario.content_type:
+            options = {'content_type': scenario.content_type}
+        elif scenario.method == 'get':
+            options = {}
+        else:
+            options = {'format': 'json'}
+        writes = RowsWritten()
+        with CaptureQueriesContext(connection) as captured, \
+                connection.execute_wrapper(writes):
+            started = time.perf_counter()
+            response = getattr(client, scenario.method)(url, data, **options)
+            content = (b''.join(response.streaming_content)
+                       if response.streaming else response.content)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(count_queries(captured))
+        rows_written.append(writes.rows)
+        sizes.add(len(content))
+        statuses.add(response.status_code)
+    return {
+        'status': sorted(statuses),
+        'queries': max(queries),
+        'rows_written': max(rows_written),
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'bytes': max(sizes),
+    }
+
+
+def run(user_id, repeat=10, only=None):
+    user = User.objects.get(id=user_id)
+    token = Token.objects.get_or_create(user=user)[0]
+    client = APIClient()
+    anonymous = APIClient()
+    staff = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    # Без прав администратора djoser отдаёт в /api/users/ только себя.
+    staff.force_authenticate(User.objects.get_or_create(
+        username='benchmark-staff',
+        defaults={'email': 'staff@benchmark.local', 'is_staff': True})[0])
+    results = {}
+    for scenario in build_scenarios(user):
+        if only and scenario.name not in only:
+            continue
+        results[scenario.name] = run_scenario(
+            scenario, staff if scenario.staff
+            else client if scenario.auth else anonymous, repeat)
+    return results
+
+
+def compare(results, baseline, latency_tolerance=None, bytes_tolerance=0.1):
+    """Список превышений бюджета относительно baseline."""
+    problems = []
+    for name, result in results.items():
+        budget = baseline.get(name)
+        if budget is None:
+            continue
+        if result['status'] != budget['status']:
+            problems.append(f'{name}: статус {result["status"]} '
+                            f'вместо {budget["status"]}')
+        if result['queries'] > budget['queries']:
+            problems.append(f'{name}: {result["queries"]} запросов '
+                            f'вместо {budget["queries"]}')
+        if result['rows_written'] > budget.get('rows_written', float('inf')):
+            problems.append(f'{name}: изменено {result["rows_written"]} '
+                            f'строк вместо {budget["rows_written"]}')
+        if result['bytes'] > budget['bytes'] * (1 + bytes_tolerance):
+            problems.append(f'{name}: ответ {result["bytes"]} байт '
+                            f'вместо {budget["bytes"]}')
+        if (latency_tolerance is not None and result['p95_ms']
+                > budget['p95_ms'] * (1 + latency_tolerance)):
+            problems.append(f'{name}: p95 {result["p95_ms"]} мс '
+                            f'вместо {budget["p95_ms"]}')
+    return problems
@@ -0,0 +1,211 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Favorite, UserRecipe
+from users.models import Subscription, User
+
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+RECIPE_LIST = 'recipe-list'
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+USER_LISTS = (Favorite, UserRecipe, Subscription)
+
+
+def get_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def is_shared_cache():
+    """Кэш API общий для всех процессов, а не свой у каждого воркера."""
+    return (settings.CACHES[settings.API_CACHE_ALIAS]['BACKEND']
+            not in LOCAL_CACHE_BACKENDS)
+
+
+def recipe_group(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def get_generations(groups):
+    """Текущие поколения групп; отсутствующие создаются."""
+    cache = get_cache()
+    keys = {group: f'api:gen:{group}' for group in groups}
+    found = cache.get_many(keys.values())
+    generations = {}
+    for group, key in keys.items():
+        if key not in found:
+            found[key] = time.time_ns()
+            cache.add(key, found[key], timeout=None)
+        generations[group] = found[key]
+    return generations
+
+
+def invalidate(*groups):
+    """Сбрасывает все ответы, собранные из данных этих групп."""
+    get_cache().set_many(
+        {f'api:gen:{group}': time.time_ns() for group in groups},
+        timeout=None)
+
+
+def user_state(user):
+    """Отпечаток избранного, корзины и подписок пользователя из базы.
+
+    Число строк и наибольший id меняются при любом добавлении или
+    удалении, поэтому отпечаток одинаков во всех процессах.
+    """
+    annotations = {
+        f'{model._meta.model_name}_{function.name.lower()}': Subquery(
+            model.objects.filter(user=OuterRef('pk')).values('user')
+            .annotate(value=function('id')).values('value'))
+        for model in USER_LISTS
+        for function in (Count, Max)
+    }
+    state = User.objects.filter(id=user.id).annotate(
+        **annotations).values_list(*annotations).first()
+    return ':'.join(map(str, state or ()))
+
+
+def build_key(request, groups, generations=None):
+    """Ключ из пути, отсортированных параметров и поколений групп."""
+    if generations is None:
+        generations = get_generations(groups)
+    params = sorted(
+        (key, value)
+        for key, values in request.GET.lists()
+        for value in values if value != ''
+    )
+    raw = '|'.join([request.get_host(), request.path, repr(params),
+                    *(f'{group}={generations[group]}' for group in groups)])
+    return 'api:response:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def get_etag(key, user_state, media_type):
+    """ETag ответа: ключ кэша, состояние пользователя и формат."""
+    etag = hashlib.md5(
+        '|'.join([key, str(user_state), media_type]).encode()).hexdigest()
+    return f'"{etag}"'
+
+
+def set_validators(response, etag, last_modified, personalized, private):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    if personalized:
+        patch_vary_headers(response, ('Authorization',))
+    if private:
+        patch_cache_control(response, no_cache=True, private=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+class CachedResponseMixin:
+    """Кэширует анонимные ответы list/retrieve.
+
+    Для аутентифицированного пользователя берётся тот же анонимный
+    ответ, а персональные поля накладываются через personalize().
+    ETag строится из того же состояния, что и ключ кэша, поэтому на
+    If-None-Match ответ 304 отдаётся без выборки данных и сериализации.
+    If-Modified-Since не проверяется: секундной точности Last-Modified
+    мало, чтобы различить две правки подряд.
+    """
+
+    cache_groups = ()
+    personalized = False
+
+    def get_cache_groups(self):
+        return self.cache_groups
+
+    def get_cache_state(self):
+        """Поколения групп для ключа и время последнего изменения."""
+        generations = get_generations(self.get_cache_groups())
+        return generations, max(generations.values()) / 10 ** 9
+
+    def use_validators(self):
+        # Поколения в кэше одного процесса другие воркеры не видят.
+        return is_shared_cache()
+
+    def use_cache(self):
+        return settings.API_CACHE_ENABLED
+
+    def personalize(self, data):
+        return data
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        generations, last_modified = self.get_cache_state()
+        key = build_key(request, self.get_cache_groups(), generations)
+        private = request.user.is_authenticated
+        etag = None
+        if self.use_validators():
+            etag = get_etag(
+                key,
+                user_state(request.user)
+                if self.personalized and private else None,
+                request.accepted_media_type)
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return set_validators(not_modified, etag, last_modified,
+                                      self.personalized, private)
+        if not self.use_cache():
+            response = handler(request, *args, **kwargs)
+        else:
+            data = get_cache().get(key)
+            if data is None:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                data = response.data
+                get_cache().set(key, data, settings.API_CACHE_TIMEOUT)
+            response = Response(self.personalize(data))
+        if etag and response.status_code == status.HTTP_200_OK:
+            set_validators(response, etag, last_modified,
+                           self.personalized, private)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve,
+                                    request, *args, **kwargs)
+
+
+def overlay_user_flags(recipes, user):
+    """Проставляет is_favorited, is_in_shopping_cart и is_subscribed.
+
+    Флаги, убранные через ?fields=, не запрашиваются.
+    """
+    if not recipes or not user.is_authenticated:
+        return recipes
+    shape = recipes[0]
+    recipe_ids = [recipe['id'] for recipe in recipes]
+    for flag, model in (('is_favorited', Favorite),
+                        ('is_in_shopping_cart', UserRecipe)):
+        if flag not in shape:
+            continue
+        marked = set(model.objects.filter(
+            user=user, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True))
+        for recipe in recipes:
+            recipe[flag] = recipe['id'] in marked
+    if isinstance(shape.get('author'), dict):
+        subscribed = set(Subscription.objects.filter(
+            user=user,
+            subscribed_to_id__in=[recipe['author']['id']
+                                  for recipe in recipes]
+        ).values_list('subscribed_to_id', flat=True))
+        for recipe in recipes:
+            recipe['author']['is_subscribed'] = (
+                recipe['author']['id'] in subscribed)
+    return recipes
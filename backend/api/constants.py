@@ -6,3 +6,21 @@ PAGINATION_SIZE = 10
 MAX_PAGINATION = 10
 EXTRA_FIELD = 3
 REGEX = r'^[\w.@+-]+$'
+INGREDIENT_SEARCH_LIMIT = 20
+SHORT_URL_ALPHABET = (
+    '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ')
+SHORT_URL_LENGTH = 7
+SHORT_URL_MULTIPLIER = 2176477521739
+SHORT_URL_OFFSET = 1234567890
+RECIPE_ORDERINGS = {
+    'popularity': ('favorites_count', 'id'),
+    '-popularity': ('-favorites_count', '-id'),
+}
+BULK_MAX_SIZE = 100
+TAG_MATCH_MODES = ('any', 'all')
+IMAGE_VARIANTS = {
+    'thumbnail': (320, 320),
+    'medium': (960, 960),
+}
+IMAGE_VARIANT_QUALITY = 80
+PRIMARY_DB_COOKIE = 'db_primary'
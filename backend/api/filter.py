@@ -1,6 +1,8 @@
 import django_filters
 
+from .constants import RECIPE_ORDERINGS, TAG_MATCH_MODES
 from .models import Ingredient, Recipe
+from .search import search_ingredients
 
 
 class RecipeFilter(django_filters.FilterSet):
@@ -9,13 +11,23 @@ class RecipeFilter(django_filters.FilterSet):
         method='filter_is_in_shopping_cart')
     author = django_filters.NumberFilter(field_name='author__id')
     tags = django_filters.CharFilter(method='filter_tags')
+    tags_match = django_filters.ChoiceFilter(
+        method='filter_tags_match',
+        choices=[(value, value) for value in TAG_MATCH_MODES])
+    exclude_tags = django_filters.CharFilter(method='filter_exclude_tags')
+    ordering = django_filters.ChoiceFilter(
+        method='filter_ordering',
+        choices=[(value, value) for value in RECIPE_ORDERINGS])
 
     class Meta:
         model = Recipe
         fields = ['is_favorited',
                   'is_in_shopping_cart',
                   'author',
-                  'tags']
+                  'tags',
+                  'tags_match',
+                  'exclude_tags',
+                  'ordering']
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
@@ -24,20 +36,33 @@ class RecipeFilter(django_filters.FilterSet):
 
     def filter_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(userrecipe__user=self.request.user)
+            return queryset.filter(favorite__user=self.request.user)
         return queryset
 
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
+
     def filter_tags(self, queryset, name, value):
         tags = self.request.query_params.getlist('tags')
         if tags:
-            return queryset.filter(tags__slug__in=tags).distinct()
+            match = self.form.cleaned_data.get('tags_match') or 'any'
+            return queryset.with_tags(tags, match)
+        return queryset
+
+    def filter_tags_match(self, queryset, name, value):
         return queryset
 
+    def filter_exclude_tags(self, queryset, name, value):
+        tags = self.request.query_params.getlist('exclude_tags')
+        return queryset.with_tags(tags, 'exclude')
+
 
 class IngredientFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(field_name='name',
-                                     lookup_expr='startswith')
+    name = django_filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ['name']
+
+    def filter_name(self, queryset, name, value):
+        return search_ingredients(queryset, value)
@@ -0,0 +1,123 @@
+import hashlib
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .constants import IMAGE_VARIANT_QUALITY, IMAGE_VARIANTS
+from .media import delete_unreferenced
+from .models import Recipe
+
+logger = logging.getLogger('api.images')
+
+_executor = None
+_lock = threading.Lock()
+
+
+def variant_name(source, digest, variant):
+    """Имя файла из хэша содержимого: его можно кэшировать навсегда."""
+    directory = posixpath.dirname(source)
+    return posixpath.join(directory, 'variants',
+                          f'{digest[:20]}_{variant}.webp')
+
+
+def variant_paths(variants):
+    return [variants[variant] for variant in IMAGE_VARIANTS
+            if variant in (variants or {})]
+
+
+def make_variants(source):
+    """Сохраняет WebP-версии картинки и возвращает их имена."""
+    with default_storage.open(source) as file:
+        content = file.read()
+    digest = hashlib.sha256(content).hexdigest()
+    variants = {'source': source}
+    with Image.open(io.BytesIO(content)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        for variant, size in IMAGE_VARIANTS.items():
+            name = variant_name(source, digest, variant)
+            if not default_storage.exists(name):
+                resized = image.copy()
+                resized.thumbnail(size, Image.LANCZOS)
+                buffer = io.BytesIO()
+                resized.save(buffer, 'WEBP', quality=IMAGE_VARIANT_QUALITY)
+                default_storage.save(name, ContentFile(buffer.getvalue()))
+            variants[variant] = name
+    return variants
+
+
+def process_recipe_image(recipe_id):
+    try:
+        source, previous = Recipe.objects.filter(id=recipe_id).values_list(
+            'image', 'image_variants').first() or (None, None)
+        if not source:
+            return
+        variants = make_variants(source)
+        # Картинку могли заменить, пока шла обработка.
+        if Recipe.objects.filter(id=recipe_id, image=source).update(
+                image_variants=variants, updated_at=timezone.now()):
+            delete_unreferenced(
+                set(variant_paths(previous)) - set(variant_paths(variants)))
+    except Exception:
+        logger.exception('Не удалось обработать картинку рецепта %s',
+                         recipe_id)
+
+
+def process_in_worker(recipe_id):
+    try:
+        process_recipe_image(recipe_id)
+    finally:
+        connections.close_all()
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix='images')
+        return _executor
+
+
+def schedule_recipe_image(recipe_id):
+    """Обработка после коммита: в пуле потоков или сразу, если он выключен."""
+    def submit():
+        if settings.IMAGE_WORKERS:
+            get_executor().submit(process_in_worker, recipe_id)
+        else:
+            process_recipe_image(recipe_id)
+
+    transaction.on_commit(submit)
+
+
+def wait():
+    """Дожидается обработки всех поставленных картинок."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def variant_urls(recipe):
+    """URL версий картинки; пока их нет — URL оригинала."""
+    variants = recipe.image_variants or {}
+    if not recipe.image:
+        return None
+    fresh = variants.get('source') == recipe.image.name
+    return {
+        variant: default_storage.url(variants[variant])
+        if fresh and variant in variants else recipe.image.url
+        for variant in IMAGE_VARIANTS
+    }
@@ -0,0 +1,188 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.cache import invalidate, is_shared_cache
+
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(path, fields):
+    with open(path, encoding='utf-8', newline='') as file:
+        reader = csv.reader(file)
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < len(fields):
+                raise CommandError(
+                    f'Строка {reader.line_num}: нет поля '
+                    f'{fields[len(row)]}.')
+            yield dict(zip(fields, row))
+
+
+def read_json(path, fields):
+    """Построчно читает JSON-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as file:
+        buffer = file.read(JSON_CHUNK_SIZE).lstrip()
+        if not buffer.startswith('['):
+            raise CommandError('JSON-файл должен содержать массив.')
+        buffer = buffer[1:]
+        number = 0
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = file.read(JSON_CHUNK_SIZE)
+                if not chunk:
+                    raise CommandError('Некорректный JSON-файл.')
+                buffer += chunk
+                continue
+            number += 1
+            missing = [field for field in fields
+                       if not isinstance(item, dict) or field not in item]
+            if missing:
+                raise CommandError(
+                    f'Объект {number}: нет полей {", ".join(missing)}.')
+            yield {field: item[field] for field in fields}
+            buffer = buffer[end:]
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+class BaseLoadCommand(BaseCommand):
+    """Потоковая загрузка справочника из CSV/JSON пачками.
+
+    Наследник задаёт model, fields и unique_field. Повторная загрузка
+    того же файла не создаёт дублей, а с --update обновляет остальные
+    поля у уже существующих записей.
+    """
+
+    model = None
+    fields = ()
+    unique_field = None
+    default_path = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=self.default_path)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--update', action='store_true',
+                            help='Обновлять существующие записи.')
+        parser.add_argument('--copy', action='store_true',
+                            help='Загрузка через COPY (только PostgreSQL).')
+
+    def handle(self, *args, **options):
+        if options['path'] is None:
+            raise CommandError('Укажите путь к файлу.')
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(f'Неизвестный формат файла: {path.suffix}')
+        if not path.exists():
+            raise CommandError(f'Файл не найден: {path}')
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy поддерживается только PostgreSQL.')
+        rows = reader(path, self.fields)
+        load_batch = self.copy_batch if options['copy'] else self.save_batch
+        started = time.monotonic()
+        total = 0
+        with transaction.atomic():
+            if options['copy']:
+                self.create_copy_table()
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                load_batch(batch, options['update'])
+                total += len(batch)
+                self.report(total, started)
+            if options['copy']:
+                self.flush_copy_table(options['update'])
+        self.after_load(options['update'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {total}'))
+
+    def report(self, total, started):
+        elapsed = time.monotonic() - started
+        speed = total / elapsed if elapsed else total
+        self.stdout.write(f'{total} строк, {speed:.0f} строк/с')
+
+    def after_load(self, update):
+        pass
+
+    def invalidate_cache(self, *groups):
+        """Сбрасывает кэш API; о локальном кэше предупреждает."""
+        invalidate(*groups)
+        if not is_shared_cache():
+            self.stderr.write(self.style.WARNING(
+                'Кэш API хранится в памяти процесса: запущенные воркеры '
+                f'увидят изменения через {settings.API_CACHE_TIMEOUT} с. '
+                'Для сброса сразу нужен общий кэш (CACHE_BACKEND).'))
+
+    def save_batch(self, batch, update):
+        unique = self.unique_field
+        rows = {row[unique]: row for row in batch}
+        self.model.objects.bulk_create(
+            [self.model(**row) for row in rows.values()],
+            ignore_conflicts=True)
+        if not update:
+            return
+        others = [field for field in self.fields if field != unique]
+        changed = []
+        for obj in self.model.objects.filter(**{f'{unique}__in': rows}):
+            row = rows[getattr(obj, unique)]
+            if any(getattr(obj, field) != row[field] for field in others):
+                for field in others:
+                    setattr(obj, field, row[field])
+                changed.append(obj)
+        self.model.objects.bulk_update(changed, others)
+
+    @property
+    def copy_table(self):
+        return f'tmp_{self.model._meta.db_table}'
+
+    def create_copy_table(self):
+        columns = ', '.join(f'{field} text' for field in self.fields)
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE TEMP TABLE {self.copy_table} '
+                           f'({columns}) ON COMMIT DROP')
+
+    def copy_batch(self, batch, update):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in batch:
+            writer.writerow([row[field] for field in self.fields])
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {self.copy_table} ({", ".join(self.fields)}) '
+                f'FROM STDIN WITH CSV', buffer)
+
+    def flush_copy_table(self, update):
+        columns = ', '.join(self.fields)
+        others = [field for field in self.fields if field != self.unique_field]
+        if update and others:
+            conflict = 'DO UPDATE SET ' + ', '.join(
+                f'{field} = EXCLUDED.{field}' for field in others)
+        else:
+            conflict = 'DO NOTHING'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.model._meta.db_table} ({columns}) '
+                f'SELECT DISTINCT ON ({self.unique_field}) {columns} '
+                f'FROM {self.copy_table} '
+                f'ON CONFLICT ({self.unique_field}) {conflict}')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Recipe, ShortLink
+
+
+class Command(BaseCommand):
+    help = 'Создаёт короткие ссылки для рецептов, у которых их нет.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = 0
+        last_id = 0
+        while True:
+            recipes = list(Recipe.objects.filter(
+                shortlink__isnull=True, id__gt=last_id
+            ).only('id').order_by('id')[:options['batch_size']])
+            if not recipes:
+                break
+            ShortLink.objects.allocate(recipes)
+            last_id = recipes[-1].id
+            total += len(recipes)
+            self.stdout.write(f'Создано ссылок: {total}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, создано ссылок: {total}'))
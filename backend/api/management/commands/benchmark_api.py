@@ -0,0 +1,94 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from api import benchmark, images
+from api.models import Recipe
+
+DEFAULT_BASELINE = settings.BASE_DIR / 'benchmarks' / 'api_baseline.json'
+
+
+class Command(BaseCommand):
+    help = ('Замеряет число запросов, задержку и размер ответа для '
+            'каждого эндпоинта API на синтетических данных.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=200)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', nargs='*',
+                            help='Запустить только указанные сценарии.')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--update-baseline', action='store_true')
+        parser.add_argument('--output', help='Куда записать результаты.')
+        parser.add_argument('--latency-tolerance', type=float,
+                            help='Допустимый рост p95, например 0.5.')
+        parser.add_argument('--with-cache', action='store_true',
+                            help='Не отключать кэш ответов API.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(
+                        MEDIA_ROOT=media_root,
+                        API_CACHE_ENABLED=options['with_cache']):
+                user_ids = benchmark.seed(
+                    users=options['users'],
+                    recipes=options['recipes'],
+                    ingredients_per_recipe=options['ingredients_per_recipe'],
+                    seed_value=options['seed'],
+                )
+                author_id = Recipe.objects.filter(
+                    author_id__in=user_ids
+                ).values_list('author_id', flat=True).first()
+                results = benchmark.run(author_id, options['repeat'],
+                                        options['only'])
+                images.wait()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        self.print_results(results)
+        if options['output']:
+            self.write(options['output'], results)
+        baseline_path = Path(options['baseline'])
+        if options['update_baseline']:
+            self.write(baseline_path, results)
+            return
+        if not baseline_path.exists():
+            return
+        problems = benchmark.compare(
+            results, json.loads(baseline_path.read_text()),
+            options['latency_tolerance'])
+        if problems:
+            raise CommandError('Превышен бюджет:\n' + '\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS('Бюджет не превышен.'))
+
+    def print_results(self, results):
+        self.stdout.write(f'{"сценарий":<36}{"статус":>10}{"запросы":>9}'
+                          f'{"строк":>7}{"p50, мс":>10}{"p95, мс":>10}'
+                          f'{"байт":>10}')
+        for name, result in results.items():
+            status = ','.join(map(str, result['status']))
+            self.stdout.write(
+                f'{name:<36}{status:>10}{result["queries"]:>9}'
+                f'{result["rows_written"]:>7}'
+                f'{result["p50_ms"]:>10}{result["p95_ms"]:>10}'
+                f'{result["bytes"]:>10}')
+
+    def write(self, path, results):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(results, indent=2, ensure_ascii=False)
+                        + '\n')
+        self.stdout.write(f'Результаты записаны в {path}')
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from api.images import process_recipe_image
+from api.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные версии картинок рецептов, где их нет.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true',
+                            help='Пересоздать версии у всех рецептов.')
+
+    def handle(self, *args, **options):
+        total = 0
+        last_id = 0
+        while True:
+            recipes = list(Recipe.objects.filter(
+                id__gt=last_id
+            ).only('id', 'image', 'image_variants').order_by(
+                'id')[:options['batch_size']])
+            if not recipes:
+                break
+            for recipe in recipes:
+                source = recipe.image_variants.get('source')
+                if options['all'] or source != recipe.image.name:
+                    process_recipe_image(recipe.id)
+                    total += 1
+            last_id = recipes[-1].id
+            self.stdout.write(f'Обработано картинок: {total}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, обработано картинок: {total}'))
@@ -0,0 +1,45 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.media import QUARANTINE_DIR, find_orphans
+
+
+class Command(BaseCommand):
+    help = ('Ищет в MEDIA_ROOT файлы, на которые не ссылается ни одна '
+            'запись, и удаляет их или переносит в карантин.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=24,
+                            help='Не трогать файлы моложе, часов.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что будет удалено.')
+        parser.add_argument('--quarantine', action='store_true',
+                            help=f'Переносить в {QUARANTINE_DIR}/ '
+                                 'вместо удаления.')
+
+    def handle(self, *args, **options):
+        root = str(settings.MEDIA_ROOT)
+        if not os.path.isdir(root):
+            self.stdout.write(f'Каталог {root} не найден.')
+            return
+        total = size = 0
+        for name, file_size in find_orphans(
+                root, options['min_age'] * 3600, options['batch_size']):
+            total += 1
+            size += file_size
+            path = os.path.join(root, name)
+            if options['dry_run']:
+                self.stdout.write(name)
+            elif options['quarantine']:
+                target = os.path.join(root, QUARANTINE_DIR, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(path, target)
+            else:
+                os.remove(path)
+        action = ('Найдено' if options['dry_run'] else 'Перенесено'
+                  if options['quarantine'] else 'Удалено')
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {total}, {size / 1024 / 1024:.1f} МБ'))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Recipe
+from api.recipe_io import RECIPE_FORMATS, export_rows, parse_since
+
+
+class Command(BaseCommand):
+    help = ('Выгружает рецепты в NDJSON/CSV в формате import_recipes, '
+            'не загружая их в память целиком.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?',
+                            help='Файл для выгрузки, по умолчанию stdout.')
+        parser.add_argument('--type', choices=RECIPE_FORMATS,
+                            default='ndjson')
+        parser.add_argument('--author', help='Email автора.')
+        parser.add_argument('--since',
+                            help='Только изменённые после этого момента, '
+                                 'ISO 8601.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        queryset = Recipe.objects.all()
+        if options['author']:
+            queryset = queryset.filter(author__email=options['author'])
+        if options['since']:
+            since = parse_since(options['since'])
+            if since is None:
+                raise CommandError(f'Некорректная дата: {options["since"]}')
+            queryset = queryset.filter(updated_at__gt=since)
+        render = RECIPE_FORMATS[options['type']][1]
+        lines = render(export_rows(queryset, options['chunk_size']))
+        if not options['path']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['path'], 'w', encoding='utf-8',
+                  newline='') as file:
+            file.writelines(lines)
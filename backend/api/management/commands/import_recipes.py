@@ -0,0 +1,53 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import images
+from api.recipe_io import (RECIPE_FORMATS, RecipeImporter,
+                           directory_image_loader)
+from users.models import User
+
+SUFFIXES = {'.ndjson': 'ndjson', '.jsonl': 'ndjson', '.csv': 'csv'}
+
+
+class Command(BaseCommand):
+    help = ('Загружает рецепты из NDJSON/CSV пачками. Повторный запуск '
+            'с тем же файлом продолжает загрузку после сбоя.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--author', required=True,
+                            help='Email автора загружаемых рецептов.')
+        parser.add_argument('--images', required=True,
+                            help='Каталог с картинками рецептов.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_type = SUFFIXES.get(path.suffix.lower())
+        if file_type is None:
+            raise CommandError(f'Неизвестный формат файла: {path.suffix}')
+        if not path.exists():
+            raise CommandError(f'Файл не найден: {path}')
+        if not Path(options['images']).is_dir():
+            raise CommandError(f'Каталог не найден: {options["images"]}')
+        author = User.objects.filter(email=options['author']).first()
+        if author is None:
+            raise CommandError(f'Пользователь не найден: {options["author"]}')
+        reader = RECIPE_FORMATS[file_type][0]
+        importer = RecipeImporter(
+            author, directory_image_loader(options['images']),
+            options['batch_size'])
+        with open(path, encoding='utf-8', newline='') as file:
+            importer.run(reader(file), self.report)
+        images.wait()
+        for number, errors in importer.errors:
+            self.stderr.write(f'Строка {number}: {errors}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: {importer.created}, пропущено существующих: '
+            f'{importer.skipped}, с ошибками: {len(importer.errors)}'))
+
+    def report(self, importer, elapsed):
+        speed = importer.rows / elapsed if elapsed else importer.rows
+        self.stdout.write(f'{importer.rows} строк, создано '
+                          f'{importer.created}, {speed:.0f} строк/с')
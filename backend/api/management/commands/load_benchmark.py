@@ -0,0 +1,89 @@
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmark import percentile
+
+DEFAULT_PATHS = ('/api/recipes/', '/api/recipes/?limit=6',
+                 '/api/ingredients/?name=са')
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест запущенного сервера: задержки и пропускная '
+            'способность при разной конкурентности. Запускается отдельно '
+            'против WSGI и ASGI, чтобы сравнить их.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Например, http://127.0.0.1:8000')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Путь запроса, можно несколько раз.')
+        parser.add_argument('--concurrency', type=int, nargs='+',
+                            default=[1, 10, 50])
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Секунд на каждый уровень конкурентности.')
+        parser.add_argument('--token', help='Токен для заголовка '
+                                            'Authorization.')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Нужен адрес вида http://host:port')
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        paths = [quote(path, safe='/?=&%')
+                 for path in options['paths'] or DEFAULT_PATHS]
+        self.stdout.write(f'{"потоков":>8}{"запр/с":>10}{"p50, мс":>10}'
+                          f'{"p95, мс":>10}{"p99, мс":>10}{"ошибок":>8}')
+        for concurrency in options['concurrency']:
+            timings, errors, elapsed = self.load(
+                url, paths, headers, concurrency, options['duration'])
+            if not timings:
+                raise CommandError('Ни один запрос не выполнен.')
+            self.stdout.write(
+                f'{concurrency:>8}{len(timings) / elapsed:>10.1f}'
+                f'{statistics.median(timings):>10.1f}'
+                f'{percentile(timings, 0.95):>10.1f}'
+                f'{percentile(timings, 0.99):>10.1f}{errors:>8}')
+
+    def load(self, url, paths, headers, concurrency, duration):
+        timings, errors = [], [0]
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def worker(offset):
+            connection = http.client.HTTPConnection(
+                url.hostname, url.port or 80, timeout=30)
+            number = offset
+            while time.monotonic() < deadline:
+                path = paths[number % len(paths)]
+                number += 1
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', path, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    failed = response.status >= 500
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    failed = True
+                spent = (time.perf_counter() - started) * 1000
+                with lock:
+                    if failed:
+                        errors[0] += 1
+                    else:
+                        timings.append(spent)
+            connection.close()
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=worker, args=(number,))
+                   for number in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return timings, errors[0], time.monotonic() - started
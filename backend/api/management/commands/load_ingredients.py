@@ -0,0 +1,18 @@
+from django.conf import settings
+
+from api.cache import INGREDIENTS
+from api.management.base import BaseLoadCommand
+from api.models import Ingredient, Recipe
+
+
+class Command(BaseLoadCommand):
+    help = 'Загружает ингредиенты из CSV или JSON файла.'
+    model = Ingredient
+    fields = ('name', 'measurement_unit')
+    unique_field = 'name'
+    default_path = settings.BASE_DIR.parent / 'data' / 'ingredients.csv'
+
+    def after_load(self, update):
+        self.invalidate_cache(INGREDIENTS)
+        if update:
+            Recipe.objects.filter(ingredients__isnull=False).touch()
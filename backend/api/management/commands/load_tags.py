@@ -0,0 +1,15 @@
+from api.cache import TAGS
+from api.management.base import BaseLoadCommand
+from api.models import Recipe, Tag
+
+
+class Command(BaseLoadCommand):
+    help = 'Загружает теги (name, slug) из CSV или JSON файла.'
+    model = Tag
+    fields = ('name', 'slug')
+    unique_field = 'slug'
+
+    def after_load(self, update):
+        self.invalidate_cache(TAGS)
+        if update:
+            Recipe.objects.filter(tags__isnull=False).touch()
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного и списков покупок.'
+
+    def handle(self, *args, **options):
+        fixed = Recipe.objects.reconcile_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено рецептов: {fixed}'))
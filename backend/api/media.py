@@ -0,0 +1,87 @@
+import os
+import time
+from itertools import islice
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models import Q
+
+from .constants import IMAGE_VARIANTS
+
+QUARANTINE_DIR = '.quarantine'
+
+
+def file_fields():
+    """Все FileField/ImageField проекта: пары (модель, имя поля)."""
+    return [
+        (model, field.name)
+        for model in apps.get_models()
+        for field in model._meta.get_fields()
+        if isinstance(field, models.FileField)
+    ]
+
+
+def variant_fields():
+    """JSON-поля с путями к версиям картинок."""
+    return [(apps.get_model('api', 'Recipe'), 'image_variants',
+             tuple(IMAGE_VARIANTS))]
+
+
+def referenced(names):
+    """Те из путей names, на которые ссылается хоть одна запись."""
+    names = list(names)
+    found = set()
+    for model, field in file_fields():
+        found.update(model._default_manager.filter(
+            **{f'{field}__in': names}).values_list(field, flat=True))
+    for model, field, keys in variant_fields():
+        condition = Q()
+        for key in keys:
+            condition |= Q(**{f'{field}__{key}__in': names})
+        for variants in model._default_manager.filter(
+                condition).values_list(field, flat=True):
+            found.update(variants[key] for key in keys if key in variants)
+    return found
+
+
+def delete_unreferenced(names):
+    names = {name for name in names if name}
+    if not names:
+        return
+    for name in names - referenced(names):
+        default_storage.delete(name)
+
+
+def delete_on_commit(names):
+    """Удаляет файлы после коммита, если на них больше никто не ссылается."""
+    names = list(names)
+    transaction.on_commit(lambda: delete_unreferenced(names))
+
+
+def scan(root, directory=''):
+    """Рекурсивно отдаёт (путь относительно root, DirEntry) без списков."""
+    with os.scandir(os.path.join(root, directory)) as entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            name = f'{directory}/{entry.name}' if directory else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                yield from scan(root, name)
+            elif entry.is_file(follow_symlinks=False):
+                yield name, entry
+
+
+def find_orphans(root, min_age, batch_size=1000):
+    """Файлы старше min_age секунд, на которые нет ссылок в базе."""
+    deadline = time.time() - min_age
+    files = ((name, entry) for name, entry in scan(root)
+             if entry.stat().st_mtime < deadline)
+    while True:
+        batch = dict(islice(files, batch_size))
+        if not batch:
+            return
+        used = referenced(batch)
+        for name, entry in batch.items():
+            if name not in used:
+                yield name, entry.stat().st_size
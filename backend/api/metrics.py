@@ -0,0 +1,61 @@
+import threading
+from bisect import bisect_left
+
+from django.http import HttpResponse
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus с разбиением по вьюхам."""
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, view, value):
+        with self._lock:
+            counts, total = self._series.get(
+                view, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._series[view] = (counts, total + value)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {view: (list(counts), total)
+                      for view, (counts, total) in self._series.items()}
+        for view, (counts, total) in sorted(series.items()):
+            label = view.replace('\\', '\\\\').replace('"', '\\"')
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{view="{label}",'
+                             f'le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{view="{label}"}} {total}')
+            lines.append(f'{self.name}_count{{view="{label}"}} {cumulative}')
+        return '\n'.join(lines)
+
+
+request_duration = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время обработки запроса.', DURATION_BUCKETS)
+request_db_duration = Histogram(
+    'foodgram_request_db_seconds',
+    'Время SQL-запросов за один запрос.', DURATION_BUCKETS)
+request_queries = Histogram(
+    'foodgram_request_queries',
+    'Число SQL-запросов за один запрос.', QUERY_BUCKETS)
+
+HISTOGRAMS = (request_duration, request_db_duration, request_queries)
+
+
+def metrics_view(request):
+    return HttpResponse(
+        '\n'.join(histogram.render() for histogram in HISTOGRAMS) + '\n',
+        content_type='text/plain; version=0.0.4; charset=utf-8')
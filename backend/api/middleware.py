@@ -0,0 +1,135 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+from .constants import PRIMARY_DB_COOKIE
+from .metrics import request_db_duration, request_duration, request_queries
+from .routers import use_replica
+
+logger = logging.getLogger('api.performance')
+
+IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+NUMBER = re.compile(r'\b\d+\b')
+
+
+def fingerprint(sql):
+    """SQL без значений, чтобы одинаковые запросы в цикле совпадали."""
+    return NUMBER.sub('?', IN_LIST.sub('(...)', sql))
+
+
+class QueryTracker:
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+
+class PerformanceMiddleware:
+    """Server-Timing, гистограммы по вьюхам и лог медленных запросов.
+
+    Включается настройкой PERFORMANCE_MONITORING; если она выключена,
+    Django исключает middleware из цепочки при запуске.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PERFORMANCE_MONITORING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tracker = QueryTracker()
+        request.render_duration = 0.0
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(tracker))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={tracker.duration * 1000:.1f}',
+            f'render;dur={request.render_duration * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        request_duration.observe(view, total)
+        request_db_duration.observe(view, tracker.duration)
+        request_queries.observe(view, tracker.count)
+        if total * 1000 >= settings.SLOW_REQUEST_MS:
+            self.log_slow_request(request, total, tracker)
+        return response
+
+    def process_template_response(self, request, response):
+        # render — только кодирование ответа; serializer.data и его
+        # запросы выполняются во вьюхе и попадают в total и db.
+        render = response.render
+
+        def timed_render():
+            started = time.perf_counter()
+            try:
+                return render()
+            finally:
+                request.render_duration += time.perf_counter() - started
+
+        response.render = timed_render
+        return response
+
+    def log_slow_request(self, request, total, tracker):
+        repeated = [
+            f'  {count}x {sql}'
+            for sql, count in tracker.fingerprints.most_common(5)
+            if count > 1
+        ]
+        logger.warning(
+            'Медленный запрос %s %s: %.0f мс, SQL: %d запросов за %.0f мс%s',
+            request.method, request.get_full_path(), total * 1000,
+            tracker.count, tracker.duration * 1000,
+            ''.join('\n' + line for line in repeated))
+
+
+class ReplicaRoutingMiddleware:
+    """Отправляет чтения GET/HEAD/OPTIONS-запросов на реплики.
+
+    После успешной записи клиент получает cookie на
+    DB_REPLICA_STICKY_SECONDS секунд и, пока она жива, читает из основной
+    базы, чтобы сразу видеть свои изменения. Метка хранится у клиента,
+    поэтому работает при любом числе воркеров и без общего кэша.
+    Без DB_REPLICAS middleware исключается из цепочки при запуске.
+    """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in SAFE_METHODS
+        token = use_replica.set(
+            safe and PRIMARY_DB_COOKIE not in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replica.reset(token)
+        if not safe and response.status_code < 400:
+            response.set_cookie(
+                PRIMARY_DB_COOKIE, '1',
+                max_age=settings.DB_REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:47
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_ingredients_count(apps, schema_editor):
+    Recipe = apps.get_model('api', 'Recipe')
+    IngredientsInRecipe = apps.get_model('api', 'IngredientsInRecipe')
+    Recipe.objects.update(ingredients_count=Coalesce(Subquery(
+        IngredientsInRecipe.objects.filter(recipe=OuterRef('pk'))
+        .values('recipe').annotate(total=Count('id')).values('total')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_recipe_popularity_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Число ингредиентов'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredientsinrecipe',
+            index=models.Index(fields=['ingredients', 'recipe'], name='ingredient_recipe_idx'),
+        ),
+        migrations.RunPython(fill_ingredients_count,
+                             migrations.RunPython.noop),
+    ]
@@ -1,13 +1,24 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 from django.core.validators import MinValueValidator
 from django.db import models
-import random
-import string
+from django.db.models import (BooleanField, Count, Exists, ExpressionWrapper,
+                              F, FloatField, OuterRef, Prefetch, Subquery,
+                              Value)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+import secrets
 
 from .constants import (MAX_LENGTH_DEFAULT,
                         MAX_LENGTH_TEN,
                         MAX_LENGTH_EIGHT,
-                        MIN_VALIDATE,)
-from users.models import User
+                        MIN_VALIDATE,
+                        SHORT_URL_ALPHABET,
+                        SHORT_URL_LENGTH,
+                        SHORT_URL_MULTIPLIER,
+                        SHORT_URL_OFFSET,)
+from users.models import Subscription, User
 
 
 class Tag(models.Model):
@@ -38,6 +49,165 @@ class Ingredient(models.Model):
         return f'{self.name} {self.measurement_unit}'
 
 
+def count_per_recipe(model):
+    """Подзапрос с числом строк model, ссылающихся на рецепт."""
+    return Coalesce(Subquery(
+        model.objects.filter(recipe=OuterRef('pk'))
+        .values('recipe').annotate(total=Count('id')).values('total')
+    ), 0)
+
+
+# Рецепты, которые сейчас сохраняются или удаляются целиком.
+saving_recipes = ContextVar('saving_recipes', default=frozenset())
+
+
+@contextmanager
+def saving_recipe(recipe_id):
+    """Правки связей рецепта внутри блока не отмечают его изменённым.
+
+    updated_at уже сдвигает save() рецепта, либо рецепт удаляется.
+    """
+    token = saving_recipes.set(saving_recipes.get() | {recipe_id})
+    try:
+        yield
+    finally:
+        saving_recipes.reset(token)
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self, user=None, fields=None, expand=()):
+        """Подгружает связи рецепта, нужные для сериализации.
+
+        fields и expand — поля из ?fields= и ?expand=: ненужные связи не
+        подгружаются, а text не читается из базы.
+        """
+        def needed(name):
+            return fields is None or name in fields
+
+        def expanded(name):
+            return fields is None or name in expand
+
+        queryset = self
+        if needed('author') and expanded('author'):
+            authors = User.objects.all()
+            if user is not None and user.is_authenticated:
+                authors = authors.annotate(is_subscribed=Exists(
+                    Subscription.objects.filter(
+                        user=user, subscribed_to=OuterRef('pk'))))
+            else:
+                authors = authors.annotate(
+                    is_subscribed=Value(False, output_field=BooleanField()))
+            queryset = queryset.prefetch_related(
+                Prefetch('author', queryset=authors))
+        if needed('tags'):
+            queryset = queryset.prefetch_related('tags')
+        if needed('ingredients'):
+            ingredients = IngredientsInRecipe.objects.all()
+            if expanded('ingredients'):
+                ingredients = ingredients.select_related('ingredients')
+            queryset = queryset.prefetch_related(
+                Prefetch('ingredients_recipes', queryset=ingredients))
+        if not needed('text'):
+            queryset = queryset.defer('text')
+        return queryset
+
+    def with_user_flags(self, user=None, fields=None):
+        """Добавляет флаги is_favorited и is_in_shopping_cart."""
+        flags = {
+            'is_favorited': Favorite,
+            'is_in_shopping_cart': UserRecipe,
+        }
+        if fields is not None:
+            flags = {name: model for name, model in flags.items()
+                     if name in fields}
+        if user is None or not user.is_authenticated:
+            return self.annotate(**{
+                name: Value(False, output_field=BooleanField())
+                for name in flags
+            })
+        return self.annotate(**{
+            name: Exists(model.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+            for name, model in flags.items()
+        })
+
+    def touch(self):
+        """Отмечает рецепты изменёнными: по updated_at строятся ETag."""
+        return self.update(updated_at=timezone.now())
+
+    def recount(self, field):
+        """Записывает в счётчик фактическое число строк.
+
+        Счётчики влияют на сортировку, поэтому updated_at тоже сдвигается.
+        """
+        return self.update(
+            **{field: count_per_recipe(COUNTED_RELATIONS[field])},
+            updated_at=timezone.now())
+
+    def reconcile_counters(self):
+        """Пересчитывает счётчики и возвращает число исправленных."""
+        actual = {field: count_per_recipe(model)
+                  for field, model in COUNTED_RELATIONS.items()}
+        drifted = self.annotate(**{
+            f'actual_{field}': value for field, value in actual.items()
+        }).exclude(**{
+            field: F(f'actual_{field}') for field in actual
+        }).values_list('id', flat=True)
+        return Recipe.objects.filter(id__in=list(drifted)).update(
+            **actual, updated_at=timezone.now())
+
+    def with_coverage(self, ingredient_ids):
+        """Рецепты, где есть хотя бы один из ингредиентов, с покрытием.
+
+        matched — сколько ингредиентов рецепта есть среди переданных,
+        missing — сколько не хватает, coverage — доля имеющихся.
+        Подсчёт идёт по индексу (ingredients, recipe) и затрагивает
+        только строки переданных ингредиентов.
+        """
+        matched = IngredientsInRecipe.objects.filter(
+            ingredients_id__in=ingredient_ids
+        )
+        return self.filter(
+            id__in=matched.values('recipe_id'),
+        ).annotate(
+            matched=Subquery(
+                matched.filter(recipe=OuterRef('pk'))
+                .values('recipe').annotate(total=Count('id'))
+                .values('total')),
+        ).annotate(
+            missing=F('ingredients_count') - F('matched'),
+            coverage=ExpressionWrapper(
+                F('matched') * 1.0 / F('ingredients_count'),
+                output_field=FloatField()),
+        )
+
+    def with_tags(self, slugs, match='any'):
+        """Рецепты с любым (any), всеми (all) или без (exclude) тегов.
+
+        Каждое условие — EXISTS по TagRecipe, поэтому строки рецептов
+        не размножаются и DISTINCT не нужен.
+        """
+        def tagged(values):
+            return Exists(TagRecipe.objects.filter(
+                recipe=OuterRef('pk'), tag__slug__in=values))
+
+        if match == 'all':
+            return self.filter(*(tagged([slug]) for slug in set(slugs)))
+        if match == 'exclude':
+            return self.filter(~tagged(slugs))
+        return self.filter(tagged(slugs))
+
+    def limited_per_author(self, authors, limit=None):
+        """Последние рецепты авторов, не более limit на автора."""
+        queryset = self.filter(author__in=authors).order_by('-id')
+        if limit is None:
+            return queryset
+        return queryset.filter(id__in=Subquery(
+            Recipe.objects.filter(author=OuterRef('author'))
+            .order_by('-id').values('id')[:limit]))
+
+
 class Recipe(models.Model):
 
     author = models.ForeignKey(
@@ -86,6 +256,37 @@ class Recipe(models.Model):
         null=False,
     )
 
+    image_variants = models.JSONField(
+        verbose_name='Версии изображения',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
+
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        db_index=True,
+    )
+
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+    )
+
+    ingredients_count = models.PositiveIntegerField(
+        verbose_name='Число ингредиентов',
+        default=0,
+    )
+
+    updated_at = models.DateTimeField(
+        verbose_name='Изменён',
+        auto_now=True,
+        db_index=True,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
@@ -122,6 +323,10 @@ class IngredientsInRecipe(models.Model):
                 name='unique_ingredient',
             )
         ]
+        indexes = [
+            models.Index(fields=['ingredients', 'recipe'],
+                         name='ingredient_recipe_idx'),
+        ]
 
 
 class TagRecipe(models.Model):
@@ -146,6 +351,9 @@ class TagRecipe(models.Model):
                 name='unique_tag',
             )
         ]
+        indexes = [
+            models.Index(fields=['tag', 'recipe'], name='tag_recipe_idx'),
+        ]
 
     def __str__(self):
         return f'Тег: {self.recipe.name} slug: {self.tag.name}'
@@ -184,6 +392,38 @@ class Favorite(models.Model):
         return f'{self.user.username} - {self.recipe.name}'
 
 
+def encode_short_url(number):
+    """Взаимно однозначно переводит номер рецепта в код из 7 символов.
+
+    Номер перемешивается умножением по модулю 62**7 на число, взаимно
+    простое с модулем, поэтому разные рецепты всегда получают разные
+    коды, а коды соседних рецептов не идут подряд. Старые случайные
+    коды имеют длину 8 и с новыми не пересекаются.
+    """
+    base = len(SHORT_URL_ALPHABET)
+    number = (number * SHORT_URL_MULTIPLIER + SHORT_URL_OFFSET) % (
+        base ** SHORT_URL_LENGTH)
+    chars = []
+    for _ in range(SHORT_URL_LENGTH):
+        number, remainder = divmod(number, base)
+        chars.append(SHORT_URL_ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+class ShortLinkManager(models.Manager):
+
+    def allocate(self, recipes, batch_size=None):
+        """Создаёт короткие ссылки для рецептов одной пачкой."""
+        return self.bulk_create(
+            [ShortLink(recipe=recipe,
+                       original_url=f'recipes/{recipe.id}',
+                       short_url=encode_short_url(recipe.id))
+             for recipe in recipes],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+
+
 class ShortLink(models.Model):
     recipe = models.OneToOneField(Recipe,
                                   unique=True,
@@ -192,12 +432,25 @@ class ShortLink(models.Model):
     short_url = models.CharField(max_length=MAX_LENGTH_TEN,
                                  unique=True)
 
+    objects = ShortLinkManager()
+
     def save(self, *args, **kwargs):
         if not self.short_url:
             self.short_url = self.generate_short_url()
         super().save(*args, **kwargs)
 
     def generate_short_url(self):
-        length = MAX_LENGTH_EIGHT
-        characters = string.ascii_letters + string.digits
-        return ''.join(random.choice(characters) for _ in range(length))
+        if self.recipe_id is not None:
+            return encode_short_url(self.recipe_id)
+        while True:
+            short_url = ''.join(secrets.choice(SHORT_URL_ALPHABET)
+                                for _ in range(MAX_LENGTH_EIGHT))
+            if not ShortLink.objects.filter(short_url=short_url).exists():
+                return short_url
+
+
+COUNTED_RELATIONS = {
+    'favorites_count': Favorite,
+    'in_carts_count': UserRecipe,
+    'ingredients_count': IngredientsInRecipe,
+}
@@ -1,11 +1,39 @@
 from rest_framework import pagination
+from rest_framework.exceptions import ValidationError
 
 from .constants import MAX_PAGINATION, PAGINATION_SIZE
 
 
+class KeysetPagination(pagination.CursorPagination):
+    """Постраничный вывод по курсору без OFFSET и COUNT(*)."""
+
+    page_size = PAGINATION_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGINATION
+    ordering = '-id'
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+    def decode_cursor(self, request):
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
+
+
 class CustomPagination(pagination.PageNumberPagination):
+    """Номера страниц, а при переданном параметре cursor — курсор.
+
+    Порядок для курсора берётся из атрибута cursor_ordering вьюсета
+    и должен идти по уникальному индексированному полю. Если выборка
+    отсортирована иначе (?ordering=, can_cook), курсор не принимается:
+    он заменил бы эту сортировку своей.
+    """
+
     max_page_size = MAX_PAGINATION
     page_size = PAGINATION_SIZE
+    keyset = None
 
     def get_page_size(self, request):
         page_size = request.query_params.get('limit', None)
@@ -15,3 +43,20 @@ class CustomPagination(pagination.PageNumberPagination):
             except ValueError:
                 return self.page_size
         return self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination(
+                getattr(view, 'cursor_ordering', None))
+            ordering = (queryset.query.order_by
+                        or queryset.model._meta.ordering)
+            if ordering and tuple(ordering) != (self.keyset.ordering,):
+                raise ValidationError(
+                    {'cursor': 'Курсор недоступен при такой сортировке.'})
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,286 @@
+import csv
+import json
+import posixpath
+import time
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework import serializers
+
+from .images import schedule_recipe_image
+from .models import (Ingredient, IngredientsInRecipe, Recipe, ShortLink, Tag,
+                     TagRecipe)
+from .serializers import RecipeImportSerializer
+from .shopping_cart import Echo
+
+CSV_FIELDS = ('name', 'text', 'cooking_time', 'image', 'tags', 'ingredients')
+
+
+def read_ndjson(lines):
+    """Пары (номер строки, объект); битая строка даёт None."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except json.JSONDecodeError:
+            yield number, None
+
+
+def read_csv(lines):
+    """CSV с колонками CSV_FIELDS: теги через запятую, ингредиенты в JSON."""
+    reader = csv.DictReader(lines)
+    for row in reader:
+        try:
+            row['tags'] = [slug.strip()
+                           for slug in (row.get('tags') or '').split(',')
+                           if slug.strip()]
+            row['ingredients'] = json.loads(row.get('ingredients') or '[]')
+        except json.JSONDecodeError:
+            row = None
+        yield reader.line_num, row
+
+
+def render_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for row in rows:
+        yield writer.writerow([
+            row['name'], row['text'], row['cooking_time'], row['image'],
+            ','.join(row['tags']),
+            json.dumps(row['ingredients'], ensure_ascii=False),
+        ])
+
+
+RECIPE_FORMATS = {
+    'ndjson': (read_ndjson, render_ndjson,
+               'application/x-ndjson; charset=utf-8'),
+    'csv': (read_csv, render_csv, 'text/csv; charset=utf-8'),
+}
+
+
+def directory_image_loader(directory):
+    """Картинки из каталога: значение image — путь внутри него."""
+    directory = Path(directory).resolve()
+
+    def load(value):
+        path = (directory / value).resolve()
+        if directory not in path.parents or not path.is_file():
+            raise ValueError(f'Картинка не найдена: {value}.')
+        try:
+            with Image.open(path) as image:
+                image.verify()
+        except OSError:
+            raise ValueError(f'Некорректная картинка: {value}.')
+        with open(path, 'rb') as file:
+            return default_storage.save(f'recipes/{path.name}', File(file))
+    return load
+
+
+def base64_image_loader(value):
+    """Картинка в base64, как в поле image у POST /api/recipes/."""
+    try:
+        file = Base64ImageField().to_internal_value(value)
+    except (ValidationError, serializers.ValidationError):
+        raise ValueError('Некорректная картинка.')
+    return default_storage.save(f'recipes/{file.name}', file)
+
+
+def media_image_loader(value):
+    """Картинка рецепта из MEDIA_ROOT, как в выгрузке: сохраняется копия.
+
+    Копия нужна, чтобы удаление исходного рецепта не унесло картинку.
+    """
+    path = posixpath.normpath(value)
+    if not path.startswith('recipes/') or not default_storage.exists(path):
+        raise ValueError(f'Картинка не найдена: {value}.')
+    with default_storage.open(path) as file:
+        return default_storage.save(path, file)
+
+
+def api_image_loader(value):
+    """Путь из GET /api/recipes/export/ или картинка в base64."""
+    if value.startswith('recipes/'):
+        return media_image_loader(value)
+    return base64_image_loader(value)
+
+
+class RecipeImporter:
+    """Загружает рецепты пачками, каждую пачку в своей транзакции.
+
+    Рецепты с уже существующим названием пропускаются, поэтому после
+    сбоя тот же файл можно загрузить повторно: готовые пачки не
+    задвоятся, а загрузка продолжится с первой незагруженной строки.
+    """
+
+    def __init__(self, author, load_image, batch_size=500):
+        self.author = author
+        self.load_image = load_image
+        self.batch_size = batch_size
+        self.rows = 0
+        self.created = 0
+        self.skipped = 0
+        self.errors = []
+
+    def run(self, rows, report=None):
+        rows = iter(rows)
+        started = time.monotonic()
+        while True:
+            chunk = list(islice(rows, self.batch_size))
+            if not chunk:
+                return self
+            self.import_chunk(chunk)
+            if report:
+                report(self, time.monotonic() - started)
+
+    def import_chunk(self, chunk):
+        self.rows += len(chunk)
+        valid, chunk_errors = [], []
+        for number, row in chunk:
+            serializer = RecipeImportSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((number, serializer.validated_data))
+            else:
+                chunk_errors.append((number, serializer.errors))
+        existing = set(Recipe.objects.filter(
+            name__in=[row['name'] for _, row in valid]
+        ).values_list('name', flat=True))
+        tags = Tag.objects.in_bulk(
+            {slug for _, row in valid for slug in row['tags']},
+            field_name='slug')
+        ingredients = Ingredient.objects.in_bulk(
+            {item['name'] for _, row in valid for item in row['ingredients']},
+            field_name='name')
+        recipes = {}
+        for number, row in valid:
+            if row['name'] in existing:
+                self.skipped += 1
+                continue
+            errors = self.relation_errors(row, tags, ingredients)
+            if row['name'] in recipes:
+                errors['name'] = [f'Название повторяется в файле: '
+                                  f'{row["name"]}.']
+            if not errors:
+                try:
+                    row['image'] = self.load_image(row['image'])
+                except ValueError as error:
+                    errors['image'] = [str(error)]
+            if errors:
+                chunk_errors.append((number, errors))
+                continue
+            recipes[row['name']] = row
+        self.errors.extend(sorted(chunk_errors, key=lambda error: error[0]))
+        if recipes:
+            self.save(recipes, tags, ingredients)
+
+    @staticmethod
+    def relation_errors(row, tags, ingredients):
+        errors = {}
+        unknown = [slug for slug in row['tags'] if slug not in tags]
+        if unknown:
+            errors['tags'] = [f'Не найдены теги: {", ".join(unknown)}.']
+        unknown = [item['name'] for item in row['ingredients']
+                   if item['name'] not in ingredients]
+        if unknown:
+            errors['ingredients'] = [
+                f'Не найдены ингредиенты: {", ".join(unknown)}.']
+        return errors
+
+    def save(self, recipes, tags, ingredients):
+        with transaction.atomic():
+            Recipe.objects.bulk_create([
+                Recipe(author=self.author, name=row['name'],
+                       text=row['text'], cooking_time=row['cooking_time'],
+                       image=row['image'],
+                       ingredients_count=len(row['ingredients']))
+                for row in recipes.values()
+            ])
+            # SQLite не возвращает id из bulk_create, название уникально.
+            ids = dict(Recipe.objects.filter(
+                name__in=recipes).values_list('name', 'id'))
+            IngredientsInRecipe.objects.bulk_create([
+                IngredientsInRecipe(
+                    recipe_id=ids[name],
+                    ingredients=ingredients[item['name']],
+                    amount=item['amount'])
+                for name, row in recipes.items()
+                for item in row['ingredients']
+            ])
+            TagRecipe.objects.bulk_create([
+                TagRecipe(recipe_id=ids[name], tag=tags[slug])
+                for name, row in recipes.items()
+                for slug in row['tags']
+            ])
+            ShortLink.objects.allocate(
+                [Recipe(id=recipe_id) for recipe_id in ids.values()])
+            for recipe_id in ids.values():
+                schedule_recipe_image(recipe_id)
+        self.created += len(recipes)
+
+
+def parse_since(value):
+    """Дата или момент в ISO 8601; None, если разобрать не удалось."""
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                return None
+            moment = datetime.combine(day, datetime.min.time())
+    except ValueError:
+        return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def export_rows(queryset, chunk_size=1000):
+    """Рецепты в формате импорта.
+
+    Рецепты читаются серверным курсором, теги и ингредиенты — двумя
+    запросами на пачку, так что память не растёт с числом рецептов.
+    """
+    recipes = queryset.order_by('id').values(
+        'id', 'name', 'text', 'cooking_time', 'image'
+    ).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(recipes, chunk_size))
+        if not chunk:
+            return
+        ids = [recipe['id'] for recipe in chunk]
+        tags = {}
+        for recipe_id, slug in TagRecipe.objects.filter(
+                recipe_id__in=ids).order_by('id').values_list(
+                    'recipe_id', 'tag__slug'):
+            tags.setdefault(recipe_id, []).append(slug)
+        ingredients = {}
+        for recipe_id, name, unit, amount in (
+                IngredientsInRecipe.objects.filter(recipe_id__in=ids)
+                .order_by('id').values_list(
+                    'recipe_id', 'ingredients__name',
+                    'ingredients__measurement_unit', 'amount')):
+            ingredients.setdefault(recipe_id, []).append(
+                {'name': name, 'measurement_unit': unit, 'amount': amount})
+        for recipe in chunk:
+            yield {
+                'name': recipe['name'],
+                'text': recipe['text'],
+                'cooking_time': recipe['cooking_time'],
+                'image': recipe['image'],
+                'tags': tags.get(recipe['id'], []),
+                'ingredients': ingredients.get(recipe['id'], []),
+            }
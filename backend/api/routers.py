@@ -0,0 +1,99 @@
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger('api.routers')
+
+use_replica = ContextVar('use_replica', default=False)
+
+# Отставание реплики в секундах; 0, если она догнала основную базу
+# или это вообще не реплика.
+LAG_SQL = {
+    'postgresql': (
+        'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()'
+        ' THEN 0 ELSE COALESCE(EXTRACT(EPOCH FROM'
+        ' now() - pg_last_xact_replay_timestamp()), 0) END'
+    ),
+}
+
+
+class ReplicaMonitor:
+    """Раз в DB_REPLICA_CHECK_INTERVAL секунд проверяет отставание реплик.
+
+    Реплика, которая отстала больше DB_REPLICA_MAX_LAG или не отвечает,
+    до следующей проверки не используется.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._status = {}
+
+    def measure_lag(self, alias):
+        connection = connections[alias]
+        sql = LAG_SQL.get(connection.vendor)
+        if sql is None:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            return float(cursor.fetchone()[0])
+
+    def is_available(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            available, checked = self._status.get(alias, (False, None))
+        if checked is not None and (
+                now - checked < settings.DB_REPLICA_CHECK_INTERVAL):
+            return available
+        try:
+            lag = self.measure_lag(alias)
+        except DatabaseError:
+            logger.warning('Реплика %s недоступна', alias, exc_info=True)
+            available = False
+        else:
+            available = lag <= settings.DB_REPLICA_MAX_LAG
+            if not available:
+                logger.warning('Реплика %s отстаёт на %.1f с', alias, lag)
+        with self._lock:
+            self._status[alias] = (available, now)
+        return available
+
+    def available(self):
+        return [alias for alias in settings.DATABASE_REPLICAS
+                if self.is_available(alias)]
+
+    def reset(self):
+        with self._lock:
+            self._status.clear()
+
+
+monitor = ReplicaMonitor()
+
+
+class ReplicaRouter:
+    """Чтения внутри безопасных запросов идут на реплики.
+
+    Флаг выставляет ReplicaRoutingMiddleware; команды, shell и запросы,
+    которые что-то пишут, читают из основной базы. Если все реплики
+    отстали или недоступны, чтения тоже идут в основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        if use_replica.get():
+            replicas = monitor.available()
+            if replicas:
+                return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,85 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Case, IntegerField, Value, When
+
+from .cache import INGREDIENTS, get_generations, is_shared_cache
+from .constants import INGREDIENT_SEARCH_LIMIT
+from .models import Ingredient
+
+EXACT, PREFIX, CONTAINS = 0, 1, 2
+
+
+def search_ingredients(queryset, query, limit=INGREDIENT_SEARCH_LIMIT):
+    """Ингредиенты, содержащие query: точные, затем по префиксу."""
+    return queryset.filter(name__icontains=query).annotate(
+        rank=Case(
+            When(name__iexact=query, then=Value(EXACT)),
+            When(name__istartswith=query, then=Value(PREFIX)),
+            default=Value(CONTAINS),
+            output_field=IntegerField(),
+        )
+    ).order_by('rank', 'name')[:limit]
+
+
+class IngredientIndex:
+    """Каталог ингредиентов в памяти процесса для автодополнения.
+
+    Имена хранятся отсортированными, поэтому точное совпадение и
+    совпадения по префиксу находятся через bisect, а подстрока ищется
+    только для добора до лимита. Индекс перестраивается, когда меняется
+    поколение кэша ингредиентов. Правки из других процессов видны через
+    это поколение только при общем кэше, поэтому с кэшем в памяти
+    процесса индекс ещё и перечитывается раз в API_CACHE_TIMEOUT секунд.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = None
+        self._loaded_at = 0
+        self._keys = []
+        self._items = []
+
+    def _load(self):
+        items = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda item: item['name'].lower())
+        self._keys = [item['name'].lower() for item in items]
+        self._items = items
+
+    def _expired(self):
+        return (not is_shared_cache() and time.monotonic() - self._loaded_at
+                > settings.API_CACHE_TIMEOUT)
+
+    def _refresh(self):
+        generation = get_generations([INGREDIENTS])
+        if generation != self._generation or self._expired():
+            with self._lock:
+                if generation != self._generation or self._expired():
+                    self._load()
+                    self._generation = generation
+                    self._loaded_at = time.monotonic()
+
+    def search(self, query, limit=INGREDIENT_SEARCH_LIMIT):
+        self._refresh()
+        keys, items = self._keys, self._items
+        query = query.lower()
+        start = bisect.bisect_left(keys, query)
+        found = []
+        for position in range(start, len(keys)):
+            if len(found) == limit or not keys[position].startswith(query):
+                break
+            found.append(position)
+        if len(found) < limit:
+            prefixed = set(found)
+            for position, key in enumerate(keys):
+                if len(found) == limit:
+                    break
+                if position not in prefixed and query in key:
+                    found.append(position)
+        return [items[position] for position in found]
+
+
+ingredient_index = IngredientIndex()
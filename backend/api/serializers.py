@@ -1,16 +1,83 @@
+from collections import Counter
+
+from django.db import transaction
 from django.db.models import Q
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework.relations import PrimaryKeyRelatedField
 from rest_framework import serializers
 
+from .constants import BULK_MAX_SIZE, MAX_LENGTH_DEFAULT, MIN_VALIDATE
+from .images import variant_urls
 from .models import (
     Favorite, Ingredient, IngredientsInRecipe,
     Recipe, ShortLink, TagRecipe,
-    Tag, UserRecipe,
+    Tag, UserRecipe, saving_recipe,
 )
 from users.models import Subscription, User
 
 
+def parse_list(request, param):
+    value = request.query_params.get(param) if request else None
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def requested_fields(request, available):
+    """Поля из ?fields=; None, если параметр не передан."""
+    fields = parse_list(request, 'fields')
+    if fields is None:
+        return None
+    unknown = fields - set(available)
+    if unknown:
+        raise serializers.ValidationError(
+            {'fields': f'Неизвестные поля: {", ".join(sorted(unknown))}.'})
+    return fields | {'id'}
+
+
+def requested_expand(request):
+    """Вложенные объекты из ?expand=, которые нужно отдать целиком."""
+    return parse_list(request, 'expand') or set()
+
+
+def resolve_ids(model, ids, name, plural):
+    """Объекты по списку id одним in_bulk и все ошибки в этом списке."""
+    if not ids:
+        return {}, [f'Рецепт должен иметь хотя бы 1 {name}.']
+    errors = []
+    duplicates = [pk for pk, count in Counter(ids).items() if count > 1]
+    if duplicates:
+        errors.append(f'Повторяющиеся {plural}: '
+                      f'{", ".join(map(str, duplicates))}.')
+    objects = model.objects.in_bulk(set(ids))
+    unknown = [pk for pk in dict.fromkeys(ids) if pk not in objects]
+    if unknown:
+        errors.append(f'Не найдены {plural}: '
+                      f'{", ".join(map(str, unknown))}.')
+    return objects, errors
+
+
+class SparseFieldsMixin:
+    """Оставляет поля из ?fields=, id возвращается всегда.
+
+    Вложенные объекты из compact_fields при выборке полей отдаются
+    компактно, а целиком — только если перечислены в ?expand=.
+    """
+
+    compact_fields = {}
+
+    def prune_fields(self, request):
+        fields = requested_fields(request, self.fields)
+        if fields is None:
+            return
+        expand = requested_expand(request)
+        for name in list(self.fields):
+            if name not in fields:
+                del self.fields[name]
+            elif name in self.compact_fields and name not in expand:
+                self.fields[name] = self.compact_fields[name]()
+
+
 class UserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
     avatar = Base64ImageField(required=False, allow_null=True)
@@ -28,6 +95,8 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Subscription.objects.filter(user=request.user,
@@ -78,6 +147,14 @@ class IngredientsInRecipeSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'measurement_unit', 'amount']
 
 
+class IngredientAmountSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='ingredients_id')
+
+    class Meta:
+        model = IngredientsInRecipe
+        fields = ['id', 'amount']
+
+
 class TagsRecipe(serializers.ModelSerializer):
     id = serializers.PrimaryKeyRelatedField(source='tags',
                                             queryset=Tag.objects.all())
@@ -99,6 +176,17 @@ class FavoriteSerializer(serializers.Serializer):
         fields = ['id', 'name', 'image', 'cooking_time']
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_MAX_SIZE,
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
 class RecipeInShoppingCard(serializers.ModelSerializer):
     id = PrimaryKeyRelatedField(queryset=Recipe.objects.all())
     name = PrimaryKeyRelatedField(queryset=Recipe.objects.all())
@@ -115,7 +203,7 @@ class RecipeInShoppingCard(serializers.ModelSerializer):
         ]
 
 
-class GetRecipeSerializer(serializers.Serializer):
+class GetRecipeSerializer(SparseFieldsMixin, serializers.Serializer):
     id = serializers.IntegerField()
     tags = TagSerializer(many=True)
     author = UserSerializer(default=serializers.CurrentUserDefault)
@@ -126,6 +214,7 @@ class GetRecipeSerializer(serializers.Serializer):
     is_favorited = serializers.SerializerMethodField()
     name = serializers.CharField()
     image = Base64ImageField(required=False, allow_null=True)
+    image_variants = serializers.SerializerMethodField()
     text = serializers.CharField()
     cooking_time = serializers.IntegerField()
 
@@ -139,15 +228,30 @@ class GetRecipeSerializer(serializers.Serializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
         ]
 
+    compact_fields = {
+        'author': lambda: serializers.IntegerField(source='author_id'),
+        'tags': lambda: serializers.PrimaryKeyRelatedField(
+            many=True, read_only=True),
+        'ingredients': lambda: IngredientAmountSerializer(
+            source='ingredients_recipes', many=True),
+    }
+
     def __init__(self, *args, **kwargs):
         self.request = kwargs.pop('context', {}).get('request', None)
         super(GetRecipeSerializer, self).__init__(*args, **kwargs)
+        self.prune_fields(self.request)
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj)
 
     def get_is_in_shopping_cart(self, validate_data):
+        if hasattr(validate_data, 'is_in_shopping_cart'):
+            return validate_data.is_in_shopping_cart
         try:
             obj = UserRecipe.objects.filter(
                 Q(recipe=validate_data)
@@ -158,6 +262,8 @@ class GetRecipeSerializer(serializers.Serializer):
             return False
 
     def get_is_favorited(self, validate_data):
+        if hasattr(validate_data, 'is_favorited'):
+            return validate_data.is_favorited
         try:
             obj = Favorite.objects.filter(
                 Q(recipe=validate_data)
@@ -168,12 +274,18 @@ class GetRecipeSerializer(serializers.Serializer):
             return False
 
 
+class CanCookRecipeSerializer(GetRecipeSerializer):
+    coverage = serializers.FloatField()
+    missing = serializers.IntegerField()
+
+    class Meta(GetRecipeSerializer.Meta):
+        fields = GetRecipeSerializer.Meta.fields + ['coverage', 'missing']
+
+
 class CreateRecipeSerializer(serializers.ModelSerializer):
-    ingredients = IngredientsInRecipeSerializer(source='ingredients_recipes',
-                                                many=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True)
+    ingredients = IngredientAmountSerializer(source='ingredients_recipes',
+                                             many=True)
+    tags = serializers.ListField(child=serializers.IntegerField())
     image = Base64ImageField(required=False, allow_null=True)
     author = UserSerializer(default=serializers.CurrentUserDefault())
     MANY_FIELDS = {'ingredients_recipes': 'update_ingredients',
@@ -192,9 +304,40 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         ]
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        user = request.user if request else None
+        instance = Recipe.objects.with_related(user).with_user_flags(
+            user).get(id=instance.id)
         return GetRecipeSerializer(
             instance,
-            context={'request': self.context.get('request')}).data
+            context={'request': request}).data
+
+    def validate(self, attrs):
+        """Проверяет ингредиенты и теги за один проход.
+
+        Id каждой модели загружаются одним запросом, ошибки по всем
+        полям возвращаются вместе.
+        """
+        errors = {}
+        ingredients = attrs.get('ingredients_recipes')
+        if ingredients is not None:
+            found, errors['ingredients'] = resolve_ids(
+                Ingredient, [ba['ingredients_id'] for ba in ingredients],
+                'ингредиент', 'ингредиенты')
+            attrs['ingredients_recipes'] = [
+                {'ingredients': found.get(ba['ingredients_id']),
+                 'amount': ba['amount']}
+                for ba in ingredients
+            ]
+        tags = attrs.get('tags')
+        if tags is not None:
+            found, errors['tags'] = resolve_ids(Tag, tags, 'тег', 'теги')
+            attrs['tags'] = [found.get(pk) for pk in tags]
+        errors = {field: messages
+                  for field, messages in errors.items() if messages}
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
 
     @classmethod
     def create_tags(cls, recipe_id, tags):
@@ -224,15 +367,40 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
 
     @classmethod
     def update_ingredients(cls, instance, new_ingredients):
-        IngredientsInRecipe.objects.filter(recipe_id=instance.id).delete()
-        cls.create_ingredients(instance.id, new_ingredients)
+        """Пишет только разницу между старым и новым составом."""
+        new_amounts = {ba['ingredients'].id: ba['amount']
+                       for ba in new_ingredients}
+        old_rows = {
+            row.ingredients_id: row
+            for row in IngredientsInRecipe.objects.filter(
+                recipe_id=instance.id)
+        }
+        removed = old_rows.keys() - new_amounts.keys()
+        if removed:
+            IngredientsInRecipe.objects.filter(
+                recipe_id=instance.id, ingredients_id__in=removed).delete()
+        changed = []
+        for ingredient_id in old_rows.keys() & new_amounts.keys():
+            row = old_rows[ingredient_id]
+            if row.amount != new_amounts[ingredient_id]:
+                row.amount = new_amounts[ingredient_id]
+                changed.append(row)
+        IngredientsInRecipe.objects.bulk_update(changed, ['amount'])
+        cls.create_ingredients(instance.id, [
+            ba for ba in new_ingredients
+            if ba['ingredients'].id not in old_rows
+        ])
+        if removed or new_amounts.keys() - old_rows.keys():
+            Recipe.objects.filter(id=instance.id).recount(
+                'ingredients_count')
 
     def update_many2us(self, instance, validated_data):
-        for field, updater_name in self.MANY_FIELDS.items():
-            data = validated_data.pop(field, None)
-            updater = getattr(self, updater_name)
-            if data is not None or not self.partial:
-                updater(instance, data or [])
+        with saving_recipe(instance.id):
+            for field, updater_name in self.MANY_FIELDS.items():
+                data = validated_data.pop(field, None)
+                updater = getattr(self, updater_name)
+                if data is not None or not self.partial:
+                    updater(instance, data or [])
         return instance
 
     def split_validated_data(self, validated_data):
@@ -254,49 +422,69 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
                 if not (str(i) in validated_data):
                     raise serializers.ValidationError(
                         f'Рецепт должен иметь {str(i)}.')
-        for i in (many2m.keys()):
-            if not many2m[str(i)]:
-                raise serializers.ValidationError(f'Рецепт должен'
-                                                  f' иметь хотя бы '
-                                                  f'1 {str(i)}.')
         if validated_data['image'] is None:
             raise serializers.ValidationError('Рецепт должен '
                                               'содержать фотографию.')
-        seen = set()
-        bool_dublicate = any(tuple(od.items()) in seen
-                             or seen.add(tuple(od.items()))
-                             for od in many2m['ingredients_recipes'])
-        if bool_dublicate:
-            raise serializers.ValidationError('В рецепте не должно'
-                                              ' быть повторяющихся'
-                                              ' ингредиетов.')
-        elif len(many2m['tags']) != len(set(many2m['tags'])):
-            raise serializers.ValidationError('В рецепте'
-                                              ' не должно быть'
-                                              ' повторяющихся тегов.')
         return basic, many2m
 
     def create(self, validated_data):
         basic, many2us = self.split_validated_data(validated_data)
-        recipe_object = self.update_many2us(
-            super().create(basic),
-            many2us)
-        ShortLink.objects.create(
-            recipe=recipe_object,
-            original_url=f'recipes/{recipe_object.id}',
-        )
+        with transaction.atomic():
+            recipe_object = self.update_many2us(
+                super().create(basic),
+                many2us)
+            ShortLink.objects.create(
+                recipe=recipe_object,
+                original_url=f'recipes/{recipe_object.id}',
+            )
         return recipe_object
 
     def update(self, instance, validated_data):
         validated_data['author'] = instance.author
         basic, many2us = self.split_validated_data(validated_data)
-        return self.update_many2us(super().update(instance, basic), many2us)
+        with transaction.atomic():
+            instance = self.update_many2us(
+                super().update(instance, basic), many2us)
+        return instance
+
+
+class ImportIngredientSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=MAX_LENGTH_DEFAULT)
+    amount = serializers.IntegerField(min_value=MIN_VALIDATE)
+
+
+class RecipeImportSerializer(serializers.Serializer):
+    """Строка файла импорта; теги и ингредиенты задаются slug и названием.
+
+    Проверяет только саму строку, существование тегов и ингредиентов
+    проверяется для всей пачки сразу.
+    """
+
+    name = serializers.CharField(max_length=MAX_LENGTH_DEFAULT)
+    text = serializers.CharField()
+    cooking_time = serializers.IntegerField(min_value=MIN_VALIDATE)
+    image = serializers.CharField()
+    tags = serializers.ListField(child=serializers.SlugField(),
+                                 allow_empty=False)
+    ingredients = ImportIngredientSerializer(many=True, allow_empty=False)
+
+    def validate(self, attrs):
+        errors = {}
+        if len(attrs['tags']) != len(set(attrs['tags'])):
+            errors['tags'] = 'Теги не должны повторяться.'
+        names = [item['name'] for item in attrs['ingredients']]
+        if len(names) != len(set(names)):
+            errors['ingredients'] = 'Ингредиенты не должны повторяться.'
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
 
 
 class RecipeShortSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     name = serializers.CharField()
     image = Base64ImageField(required=False, allow_null=True)
+    image_variants = serializers.SerializerMethodField()
     cooking_time = serializers.IntegerField()
 
     class Meta:
@@ -304,18 +492,22 @@ class RecipeShortSerializer(serializers.Serializer):
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time',
         ]
 
+    def get_image_variants(self, obj):
+        return variant_urls(obj)
 
-class SubscribeSerializer(serializers.Serializer):
+
+class SubscribeSerializer(SparseFieldsMixin, serializers.Serializer):
     id = serializers.IntegerField()
     username = serializers.CharField()
     first_name = serializers.CharField()
     last_name = serializers.CharField()
     email = serializers.CharField()
     is_subscribed = serializers.BooleanField()
-    avatar = serializers.CharField()
+    avatar = Base64ImageField(required=False, allow_null=True)
     recipes_count = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
 
@@ -329,20 +521,23 @@ class SubscribeSerializer(serializers.Serializer):
                   'recipes_count',
                   'recipes', ]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prune_fields(self.context.get('request'))
+
     def get_recipes(self, value):
-        if 'limit' in value:
-            items = Recipe.objects.filter(
-                author_id=value['id'])[:int(value['limit'])]
+        recipes = self.context.get('recipes')
+        if recipes is not None:
+            items = recipes.get(value.id, [])
         else:
-            items = Recipe.objects.filter(author_id=value['id'])
-        ret_list = RecipeShortSerializer(items, many=True)
-        return ret_list.data
+            items = Recipe.objects.limited_per_author(
+                [value], self.context.get('recipes_limit'))
+        return RecipeShortSerializer(items, many=True).data
 
     def get_recipes_count(self, value):
-        items = Recipe.objects.filter(author_id=value['id'])
-        if 'limit' in value:
-            return min(len(items), int(value['limit']))
-        return len(items)
+        if hasattr(value, 'recipes_count'):
+            return value.recipes_count
+        return value.recipe_set.count()
 
 
 class FullShortLinkSerializer(serializers.ModelSerializer):
@@ -0,0 +1,46 @@
+import csv
+
+from django.db.models import Sum
+
+from .models import IngredientsInRecipe
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def get_shopping_list(user):
+    """Суммирует ингредиенты всех рецептов из корзины одним запросом."""
+    return (
+        IngredientsInRecipe.objects
+        .filter(recipe__userrecipe__user=user)
+        .values('ingredients__name', 'ingredients__measurement_unit')
+        .annotate(amount=Sum('amount'))
+        .order_by('ingredients__name')
+    )
+
+
+def render_txt(items):
+    yield 'Список покупок\n\n'
+    for item in items.iterator():
+        yield (f'{item["ingredients__name"]} '
+               f'({item["ingredients__measurement_unit"]}) — '
+               f'{item["amount"]}\n')
+
+
+def render_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(['name', 'measurement_unit', 'amount'])
+    for item in items.iterator():
+        yield writer.writerow([item['ingredients__name'],
+                               item['ingredients__measurement_unit'],
+                               item['amount']])
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+}
@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import HttpResponsePermanentRedirect
+from django.shortcuts import redirect
+
+from .models import ShortLink
+
+
+class ShortLinkResolver:
+    """LRU-кэш short_url -> путь рецепта с ограничением по времени жизни.
+
+    При первом обращении кэш заполняется последними ссылками, дальше
+    при попадании в кэш база данных не используется.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._links = OrderedDict()
+        self._warmed = False
+
+    def _put(self, short_url, path):
+        self._links[short_url] = (path, time.monotonic() + self.ttl)
+        self._links.move_to_end(short_url)
+        while len(self._links) > self.size:
+            self._links.popitem(last=False)
+
+    def warm_up(self):
+        links = ShortLink.objects.order_by('-id').values_list(
+            'short_url', 'original_url')[:self.size]
+        with self._lock:
+            for short_url, original_url in reversed(links):
+                self._put(short_url, f'/{original_url}')
+            self._warmed = True
+
+    def cached(self, short_url):
+        """Путь из кэша без обращения к базе или None."""
+        with self._lock:
+            cached = self._links.get(short_url)
+            if cached is not None and cached[1] > time.monotonic():
+                self._links.move_to_end(short_url)
+                self.hits += 1
+                return cached[0]
+        return None
+
+    def resolve(self, short_url):
+        """Путь рецепта по короткой ссылке или None."""
+        if not self._warmed:
+            self.warm_up()
+        path = self.cached(short_url)
+        if path is not None:
+            return path
+        with self._lock:
+            self.misses += 1
+        original_url = ShortLink.objects.filter(
+            short_url=short_url
+        ).values_list('original_url', flat=True).first()
+        if original_url is None:
+            return None
+        with self._lock:
+            self._put(short_url, f'/{original_url}')
+        return f'/{original_url}'
+
+    def invalidate(self, short_url):
+        with self._lock:
+            self._links.pop(short_url, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._links),
+                'max_size': self.size,
+            }
+
+
+def redirect_response(recipe_path):
+    if settings.SHORT_LINK_PERMANENT_REDIRECT:
+        return HttpResponsePermanentRedirect(recipe_path)
+    return redirect(recipe_path)
+
+
+resolver = ShortLinkResolver(settings.SHORT_LINK_CACHE_SIZE,
+                             settings.SHORT_LINK_CACHE_TTL)
@@ -0,0 +1,125 @@
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.db.models import Subquery
+from django.dispatch import receiver
+
+from .cache import INGREDIENTS, TAGS, invalidate
+from .images import schedule_recipe_image, variant_paths
+from .media import delete_on_commit
+from .models import (Ingredient, IngredientsInRecipe, Recipe, ShortLink, Tag,
+                     TagRecipe, saving_recipes)
+from .shortlinks import resolver
+from users.models import User
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_changed(sender, instance, **kwargs):
+    source = (instance.image_variants or {}).get('source')
+    if instance.image and source != instance.image.name:
+        schedule_recipe_image(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    # Состояние списка — наибольшие id и updated_at, удаление их не
+    # меняет. Отмечается изменённым последний рецепт.
+    Recipe.objects.filter(id=Subquery(
+        Recipe.objects.order_by('-id').values('id')[:1])).touch()
+
+
+@receiver(post_save, sender=IngredientsInRecipe)
+@receiver(post_delete, sender=IngredientsInRecipe)
+@receiver(post_save, sender=TagRecipe)
+@receiver(post_delete, sender=TagRecipe)
+def recipe_relation_changed(sender, instance, **kwargs):
+    # Связи правятся и отдельно от рецепта, например в админке.
+    if instance.recipe_id not in saving_recipes.get():
+        Recipe.objects.filter(id=instance.recipe_id).touch()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    invalidate(TAGS)
+    Recipe.objects.filter(tags=instance).touch()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    invalidate(INGREDIENTS)
+    Recipe.objects.filter(ingredients=instance).touch()
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created=False, update_fields=None,
+                   **kwargs):
+    if created or (update_fields
+                   and set(update_fields) <= {'last_login', 'password'}):
+        return
+    Recipe.objects.filter(author=instance).touch()
+
+
+@receiver(post_save, sender=ShortLink)
+@receiver(post_delete, sender=ShortLink)
+def short_link_changed(sender, instance, **kwargs):
+    resolver.invalidate(instance.short_url)
+
+
+FILE_FIELDS = {Recipe: 'image', User: 'avatar'}
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=User)
+def file_replaced(sender, instance, update_fields=None, **kwargs):
+    field = FILE_FIELDS[sender]
+    if instance._state.adding or (update_fields is not None
+                                  and field not in update_fields):
+        return
+    old = sender.objects.filter(pk=instance.pk).values_list(
+        field, flat=True).first()
+    if old and old != getattr(instance, field).name:
+        delete_on_commit([old])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_files_deleted(sender, instance, **kwargs):
+    delete_on_commit([instance.image.name,
+                      *variant_paths(instance.image_variants)])
+
+
+@receiver(post_delete, sender=User)
+def avatar_deleted(sender, instance, **kwargs):
+    delete_on_commit([instance.avatar.name])
+
+
+@receiver(request_finished)
+def mark_connections_used(sender, **kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.last_used = now
+
+
+@receiver(request_started)
+def check_connections(sender, **kwargs):
+    """Закрывает оборвавшиеся постоянные соединения до начала запроса.
+
+    Проверяются только соединения, простоявшие дольше
+    DB_CONN_HEALTH_CHECK_IDLE секунд: обрываются по таймауту обычно
+    они, а при частых запросах лишний SELECT 1 не выполняется.
+    """
+    if not settings.DB_CONN_HEALTH_CHECKS:
+        return
+    now = time.monotonic()
+    for connection in connections.all():
+        if (connection.connection is not None
+                and now - getattr(connection, 'last_used', 0)
+                > settings.DB_CONN_HEALTH_CHECK_IDLE
+                and not connection.is_usable()):
+            connection.close()
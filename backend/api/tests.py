@@ -0,0 +1,350 @@
+import base64
+import io
+import json
+import os
+import tempfile
+import time
+
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+
+from api import benchmark
+from api.media import QUARANTINE_DIR, find_orphans
+from api.metrics import request_duration
+from api.models import (Favorite, Ingredient, IngredientsInRecipe, Recipe,
+                        Tag, TagRecipe)
+from api.user_lists import REMOVED, add_recipes, remove_recipes
+from users.models import User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(API_CACHE_ENABLED=False, MEDIA_ROOT=MEDIA_ROOT)
+class RecipeListQueriesTest(TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user_ids = benchmark.seed(users=5, recipes=30, favorites=5,
+                                  subscriptions=3)
+        cls.user = User.objects.get(id=user_ids[0])
+
+    def assert_flat(self, client):
+        with CaptureQueriesContext(connection) as small:
+            response = client.get('/api/recipes/?limit=2')
+        self.assertEqual(len(response.json()['results']), 2)
+        with self.assertNumQueries(len(small)):
+            response = client.get('/api/recipes/?limit=10')
+        self.assertEqual(len(response.json()['results']), 10)
+
+    def test_anonymous(self):
+        self.assert_flat(APIClient())
+
+    def test_authenticated(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assert_flat(client)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class SubscriptionsLimitTest(TestCase):
+    """Отрицательный recipes_limit не учитывается."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user_ids = benchmark.seed(users=5, recipes=10, subscriptions=3)
+        cls.user = User.objects.get(id=user_ids[0])
+
+    def test_negative_limit(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for url in ('/api/users/subscriptions/',
+                    '/api/users/subscriptions/?recipes_limit=-1'):
+            with self.subTest(url=url):
+                self.assertEqual(client.get(url).status_code, 200)
+
+
+@override_settings(API_CACHE_ENABLED=False, MEDIA_ROOT=MEDIA_ROOT)
+class CursorOrderingTest(TestCase):
+    """Курсор не подменяет другую сортировку выборки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed(users=2, recipes=5)
+        cls.ingredient_id = Ingredient.objects.values_list(
+            'id', flat=True).first()
+
+    def test_cursor(self):
+        client = APIClient()
+        for url, expected in (
+            ('/api/recipes/?cursor=', 200),
+            ('/api/recipes/?cursor=&ordering=popularity', 400),
+            (f'/api/recipes/can_cook/?ingredients={self.ingredient_id}'
+             f'&cursor=', 400),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(client.get(url).status_code, expected)
+
+
+class LoadCommandTest(TestCase):
+    """Пропущенное поле в файле справочника даёт понятную ошибку."""
+
+    def load(self, suffix, content):
+        with tempfile.NamedTemporaryFile(
+                'w', suffix=suffix, encoding='utf-8') as file:
+            file.write(content)
+            file.flush()
+            call_command('load_ingredients', file.name, stdout=io.StringIO(),
+                         stderr=io.StringIO())
+
+    def test_missing_field(self):
+        for suffix, content in (('.json', '[{"name": "x"}]'),
+                                ('.csv', 'x\n')):
+            with self.subTest(suffix=suffix):
+                with self.assertRaisesMessage(CommandError,
+                                              'measurement_unit'):
+                    self.load(suffix, content)
+        self.assertFalse(Ingredient.objects.filter(name='x').exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class UserListCountersTest(TestCase):
+    """Счётчики меняются ровно на число добавленных и удалённых строк."""
+
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed(users=2, recipes=2)
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='x')
+        cls.ids = sorted(Recipe.objects.values_list('id', flat=True))
+
+    def counts(self):
+        return list(Recipe.objects.filter(id__in=self.ids).order_by(
+            'id').values_list('favorites_count', flat=True))
+
+    def test_add_remove(self):
+        before = self.counts()
+        add_recipes('favorite', self.user, self.ids)
+        add_recipes('favorite', self.user, self.ids)
+        self.assertEqual(self.counts(), [count + 1 for count in before])
+        remove_recipes('favorite', self.user, self.ids[:1])
+        remove_recipes('favorite', self.user, self.ids[:1])
+        self.assertEqual(self.counts(), [before[0], before[1] + 1])
+
+    def test_drift(self):
+        # Строка добавлена в обход add_recipes, счётчик её не учёл.
+        Favorite.objects.create(user=self.user, recipe_id=self.ids[0])
+        Recipe.objects.filter(id=self.ids[0]).update(favorites_count=0)
+        result = remove_recipes('favorite', self.user, self.ids[:1])
+        self.assertEqual(result, {self.ids[0]: REMOVED})
+        self.assertEqual(self.counts()[0], Favorite.objects.filter(
+            recipe_id=self.ids[0]).count())
+
+
+@override_settings(PERFORMANCE_MONITORING=True, MEDIA_ROOT=MEDIA_ROOT)
+class PerformanceMetricsTest(TestCase):
+    """Рецепты и ингредиенты попадают в разные серии метрик."""
+
+    def test_view_labels(self):
+        client = APIClient()
+        for url in ('/api/recipes/', '/api/ingredients/'):
+            response = client.get(url)
+            self.assertIn('render;dur=', response['Server-Timing'])
+        metrics = request_duration.render()
+        self.assertIn('view="Recipe-list"', metrics)
+        self.assertIn('view="Ingredient-list"', metrics)
+
+
+@override_settings(API_CACHE_ENABLED=True, MEDIA_ROOT=MEDIA_ROOT)
+class RecipeValidatorsTest(TestCase):
+    """ETag рецептов строится из базы, а не из счётчиков в кэше."""
+
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed(users=2, recipes=3)
+        cls.recipe = Recipe.objects.first()
+
+    def test_change_without_signals(self):
+        client = APIClient()
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.id}/'):
+            with self.subTest(url=url):
+                etag = client.get(url)['ETag']
+                response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                # Так рецепт меняет другой процесс или команда.
+                name = f'Правка {url}'
+                Recipe.objects.filter(id=self.recipe.id).update(
+                    name=name, updated_at=timezone.now())
+                response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(name, response.content.decode())
+
+    def test_list_state(self):
+        client = APIClient()
+        url = '/api/recipes/?ordering=popularity'
+        changes = (
+            lambda: Recipe.objects.order_by('id').first().delete(),
+            lambda: add_recipes('favorite', User.objects.create_user(
+                username='fan', email='fan@example.com', password='x'),
+                [Recipe.objects.order_by('id').first().id]),
+        )
+        for change in changes:
+            etag = client.get(url)['ETag']
+            with CaptureQueriesContext(connection) as hit:
+                client.get(url)
+            # Ответ из кэша стоит одного запроса к индексам, без COUNT(*).
+            self.assertEqual(len(hit), 1)
+            self.assertNotIn('COUNT', hit[0]['sql'].upper())
+            change()
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+
+    def test_relation_change(self):
+        client = APIClient()
+        url = f'/api/recipes/{self.recipe.id}/'
+        changes = (
+            lambda: IngredientsInRecipe.objects.filter(
+                recipe=self.recipe).first().save(),
+            lambda: TagRecipe.objects.filter(recipe=self.recipe).delete(),
+        )
+        for change in changes:
+            etag = client.get(url)['ETag']
+            change()
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['tags'], [])
+
+    def test_if_modified_since_ignored(self):
+        response = APIClient().get(
+            f'/api/recipes/{self.recipe.id}/',
+            HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_WORKERS=0)
+class RecipeExportImportTest(TestCase):
+    """Выгрузку через API можно загрузить обратно через API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed(users=2, recipes=4)
+        cls.user = Recipe.objects.first().author
+        content = base64.b64decode(
+            benchmark.image_payload().split(',', 1)[1])
+        for recipe in Recipe.objects.filter(author=cls.user):
+            recipe.image = default_storage.save(
+                recipe.image.name, ContentFile(content))
+            recipe.save(update_fields=['image'])
+
+    def test_round_trip(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/recipes/export/?type=ndjson')
+        rows = [json.loads(line) for line in b''.join(
+            response.streaming_content).decode().splitlines()]
+        self.assertTrue(rows)
+        for row in rows:
+            row['name'] += ' (копия)'
+        response = client.post(
+            '/api/recipes/import/?type=ndjson',
+            ''.join(json.dumps(row) + '\n' for row in rows),
+            content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['created'], len(rows),
+                         response.content)
+        copies = Recipe.objects.filter(name__endswith=' (копия)')
+        originals = {row['image'] for row in rows}
+        for image in copies.values_list('image', flat=True):
+            self.assertNotIn(image, originals)
+
+
+@override_settings(ROOT_URLCONF='backend.asgi_urls', MEDIA_ROOT=MEDIA_ROOT,
+                   IMAGE_WORKERS=0)
+class AsgiWriteTest(TestCase):
+    """Запись через async-маршруты ASGI с токеном проходит без CSRF."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user_ids = benchmark.seed(users=2, recipes=2)
+        cls.user = User.objects.get(id=user_ids[0])
+        cls.token = Token.objects.create(user=cls.user).key
+        cls.tag_id = Tag.objects.values_list('id', flat=True).first()
+        cls.ingredient_id = Ingredient.objects.values_list(
+            'id', flat=True).first()
+
+    async def test_create_update_delete(self):
+        client = AsyncClient(enforce_csrf_checks=True)
+        options = {'content_type': 'application/json',
+                   'authorization': f'Token {self.token}'}
+        data = {
+            'name': 'ASGI', 'text': 'Описание', 'cooking_time': 5,
+            'image': benchmark.image_payload(), 'tags': [self.tag_id],
+            'ingredients': [{'id': self.ingredient_id, 'amount': 10}],
+        }
+        response = await client.post('/api/recipes/', data, **options)
+        self.assertEqual(response.status_code, 201, response.content)
+        url = f'/api/recipes/{response.json()["id"]}/'
+        response = await client.patch(url, {**data, 'cooking_time': 7},
+                                      **options)
+        self.assertEqual(response.status_code, 200, response.content)
+        response = await client.delete(url, **options)
+        self.assertEqual(response.status_code, 204, response.content)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_WORKERS=0)
+class MediaGarbageTest(TestCase):
+    """Сборщик мусора удаляет только файлы без ссылок из базы."""
+
+    def setUp(self):
+        benchmark.seed(users=1, recipes=1)
+        self.recipe = Recipe.objects.get()
+        self.content = base64.b64decode(
+            benchmark.image_payload().split(',', 1)[1])
+        Recipe.objects.filter(id=self.recipe.id).update(
+            image='recipes/used.png',
+            image_variants={'thumbnail': 'recipes/used-thumbnail.webp'})
+        User.objects.filter(id=self.recipe.author_id).update(
+            avatar='avatars/avatar.png')
+        for name in ('recipes/used.png', 'recipes/used-thumbnail.webp',
+                     'avatars/avatar.png', 'recipes/orphan.png',
+                     f'{QUARANTINE_DIR}/recipes/old.png'):
+            self.create_file(name, age=7200)
+        self.create_file('recipes/young.png', age=0)
+
+    def create_file(self, name, age):
+        path = os.path.join(default_storage.location, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(self.content)
+        moment = time.time() - age
+        os.utime(path, (moment, moment))
+
+    def test_find_orphans(self):
+        orphans = [name for name, _ in find_orphans(
+            default_storage.location, min_age=3600)]
+        self.assertEqual(orphans, ['recipes/orphan.png'])
+
+    def test_quarantine(self):
+        call_command('collect_media_garbage', '--min-age', '1',
+                     '--quarantine', stdout=io.StringIO())
+        self.assertFalse(default_storage.exists('recipes/orphan.png'))
+        self.assertTrue(default_storage.exists(
+            f'{QUARANTINE_DIR}/recipes/orphan.png'))
+        self.assertTrue(default_storage.exists('recipes/young.png'))
+
+    def test_replaced_image_deleted_after_commit(self):
+        recipe = Recipe.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.image = default_storage.save(
+                'recipes/new.png', ContentFile(self.content))
+            recipe.save()
+            self.assertTrue(default_storage.exists('recipes/used.png'))
+        self.assertFalse(default_storage.exists('recipes/used.png'))
@@ -6,13 +6,13 @@ from rest_framework.routers import DefaultRouter
 from .views import (MyUserViewSet, IngredientsViewSet,
                     RecipeViewSet, ShoppingCartViewSet,
                     FavoriteViewSet, SubscribeViewSet,
-                    ShortLinkViewSet, TagView)
+                    ShortLinkViewSet, TagView, short_link_stats)
 
 api_v1 = DefaultRouter()
 api_v1.register('users', MyUserViewSet, basename='user')
 api_v1.register('tags', TagView, basename='Tag')
 api_v1.register('ingredients', IngredientsViewSet, basename='Ingredient')
-api_v1.register('recipes', RecipeViewSet, basename='Ingredient')
+api_v1.register('recipes', RecipeViewSet, basename='Recipe')
 api_v1.register(r'recipes/(?P<recipes_id>\d+)/shopping_cart',
                 ShoppingCartViewSet,
                 basename='ShoppingCart')
@@ -28,6 +28,7 @@ api_v1.register(r'users/(?P<user_id>\d+)/subscribe',
 
 
 urlpatterns = [
+    path('short-links/stats/', short_link_stats, name='short_link_stats'),
     path('', include(api_v1.urls)),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
@@ -0,0 +1,65 @@
+from django.db import transaction
+
+from .models import Favorite, Recipe, UserRecipe
+
+ADDED = 'added'
+ALREADY_ADDED = 'already_added'
+REMOVED = 'removed'
+NOT_ADDED = 'not_added'
+NOT_FOUND = 'not_found'
+
+USER_LISTS = {
+    'favorite': (Favorite, 'favorites_count'),
+    'shopping_cart': (UserRecipe, 'in_carts_count'),
+}
+
+
+def add_recipes(list_name, user, recipe_ids):
+    """Добавляет рецепты в избранное или корзину одной транзакцией.
+
+    Возвращает статус для каждого id. Строки рецептов блокируются до
+    проверки списка, поэтому параллельный запрос ждёт и видит уже
+    добавленные рецепты. Счётчики заблокированных рецептов
+    пересчитываются: так исправляется и расхождение из-за строк,
+    добавленных в обход этих функций, например в админке.
+    """
+    model, counter = USER_LISTS[list_name]
+    with transaction.atomic():
+        found = set(Recipe.objects.select_for_update().filter(
+            id__in=recipe_ids).order_by('id').values_list('id', flat=True))
+        existing = set(model.objects.filter(
+            user=user, recipe_id__in=found
+        ).values_list('recipe_id', flat=True))
+        new = found - existing
+        if new:
+            model.objects.bulk_create(
+                [model(user=user, recipe_id=recipe_id) for recipe_id in new],
+                ignore_conflicts=True)
+            Recipe.objects.filter(id__in=new).recount(counter)
+    return {
+        recipe_id: (NOT_FOUND if recipe_id not in found
+                    else ALREADY_ADDED if recipe_id in existing
+                    else ADDED)
+        for recipe_id in recipe_ids
+    }
+
+
+def remove_recipes(list_name, user, recipe_ids):
+    """Удаляет рецепты из избранного или корзины одной транзакцией."""
+    model, counter = USER_LISTS[list_name]
+    with transaction.atomic():
+        found = set(Recipe.objects.select_for_update().filter(
+            id__in=recipe_ids).order_by('id').values_list('id', flat=True))
+        existing = set(model.objects.filter(
+            user=user, recipe_id__in=found
+        ).values_list('recipe_id', flat=True))
+        if existing:
+            model.objects.filter(user=user,
+                                 recipe_id__in=existing).delete()
+            Recipe.objects.filter(id__in=existing).recount(counter)
+    return {
+        recipe_id: (NOT_FOUND if recipe_id not in found
+                    else REMOVED if recipe_id in existing
+                    else NOT_ADDED)
+        for recipe_id in recipe_ids
+    }
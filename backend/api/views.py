@@ -1,38 +1,70 @@
-from django.db.models import Q
+from django.conf import settings
+from django.db.models import (BooleanField, Count, Exists, Max, OuterRef, Q,
+                              Value)
 import django_filters
 from django_filters.rest_framework import DjangoFilterBackend
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import (status,
                             viewsets)
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import (
-    IsAuthenticated, IsAuthenticatedOrReadOnly,
+    IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly,
 )
 from rest_framework.response import Response
 
+from .cache import (INGREDIENTS, RECIPE_LIST, TAGS, CachedResponseMixin,
+                    overlay_user_flags, recipe_group)
 from .filter import RecipeFilter, IngredientFilter
 from .models import (Tag, Ingredient, Recipe,
-                     UserRecipe, Favorite,
-                     ShortLink)
-from .serializers import (AvatarSerializer,
+                     Favorite,
+                     ShortLink, saving_recipe)
+from .serializers import (AvatarSerializer, CanCookRecipeSerializer,
                           CreateRecipeSerializer,
                           FavoriteSerializer, GetRecipeSerializer,
                           TagSerializer, IngredientSerializer,
-                          RecipeInShoppingCard, SubscribeSerializer,
+                          RecipeIdsSerializer, RecipeInShoppingCard,
+                          SubscribeSerializer,
                           ShortLinkSerializer,
+                          requested_expand, requested_fields,
                           )
+from .recipe_io import (RECIPE_FORMATS, RecipeImporter, api_image_loader,
+                        export_rows, parse_since)
+from .search import ingredient_index
 from .serializers import UserSerializer
+from .shortlinks import resolver
+from .user_lists import ADDED, REMOVED, add_recipes, remove_recipes
+from .shopping_cart import SHOPPING_LIST_FORMATS, get_shopping_list
 from .pagination import CustomPagination
 from .permissions import OwnerOrReadOnly
 from users.models import User, Subscription
 
 
+def get_recipes_limit(request):
+    """Значение recipes_limit; отсутствующее и некорректное не учитывается."""
+    try:
+        limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return None
+    return limit if limit >= 0 else None
+
+
 class MyUserViewSet(UserViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticatedOrReadOnly, ]
+    cursor_ordering = 'username'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if self.action in ('list', 'retrieve') and user.is_authenticated:
+            # is_subscribed одним подзапросом, а не запросом на строку.
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=user, subscribed_to=OuterRef('pk'))))
+        return queryset
 
     @action(
         detail=False,
@@ -71,25 +103,33 @@ class MyUserViewSet(UserViewSet):
         detail=False,
         url_path='subscriptions',
         pagination_class=CustomPagination,
+        permission_classes=[IsAuthenticated],
     )
     def get_subscriptions(self, *args, **kwargs):
-        subscriptions_list = Subscription.objects.filter(
-            user=self.request.user)
-        use1r = []
-        for i in subscriptions_list:
-            new_user = UserSerializer(i.subscribed_to).data
-            new_user['is_subscribed'] = True
-            if 'recipes_limit' in self.request.GET:
-                new_user['limit'] = self.request.GET['recipes_limit']
-            use1r.append(new_user)
-        paginator = self.paginator
-        result_page = paginator.paginate_queryset(use1r, self.request)
-        serializer = SubscribeSerializer(result_page, many=True)
-        return paginator.get_paginated_response(serializer.data)
-
-
-class TagView(viewsets.ReadOnlyModelViewSet):
+        fields = requested_fields(self.request,
+                                  SubscribeSerializer().fields)
+        queryset = User.objects.filter(
+            subscribers__user=self.request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        ).order_by('username')
+        if fields is None or 'recipes_count' in fields:
+            queryset = queryset.annotate(recipes_count=Count('recipe'))
+        page = self.paginate_queryset(queryset)
+        recipes = {}
+        if fields is None or 'recipes' in fields:
+            for recipe in Recipe.objects.limited_per_author(
+                    page, get_recipes_limit(self.request)):
+                recipes.setdefault(recipe.author_id, []).append(recipe)
+        serializer = SubscribeSerializer(
+            page, many=True,
+            context={'recipes': recipes, 'request': self.request})
+        return self.get_paginated_response(serializer.data)
+
+
+class TagView(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
+    cache_groups = (TAGS,)
     serializer_class = TagSerializer
     pagination_class = None
 
@@ -116,25 +156,34 @@ class ShortLinkViewSet(viewsets.ModelViewSet):
         return Response({'short-link': serializer.data[0]['short-link']})
 
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def short_link_stats(request):
+    return Response(resolver.stats())
+
+
+class IngredientsViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
+    cache_groups = (INGREDIENTS,)
     serializer_class = IngredientSerializer
     filter_backends = [django_filters.rest_framework.DjangoFilterBackend]
     filterset_class = IngredientFilter
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name and settings.INGREDIENT_INDEX_ENABLED:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
+
 
 class ShoppingCartViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated, ]
 
     def create(self, *args, **kwargs):
         recipe = get_object_or_404(Recipe, id=kwargs['recipes_id'])
-        shopping_cart_obj = UserRecipe.objects.filter(
-            Q(recipe_id=recipe.id) & Q(user_id=self.request.user.id)).exists()
-        if recipe is not None and not shopping_cart_obj:
-            UserRecipe.objects.bulk_create([
-                UserRecipe(recipe=recipe, user=self.request.user)
-            ])
+        result = add_recipes('shopping_cart', self.request.user, [recipe.id])
+        if result[recipe.id] == ADDED:
             serializer = RecipeInShoppingCard(recipe)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(status=status.HTTP_400_BAD_REQUEST)
@@ -145,12 +194,10 @@ class ShoppingCartViewSet(viewsets.ModelViewSet):
     )
     def delete(self, *args, **kwargs):
         recipe = get_object_or_404(Recipe, id=kwargs['recipes_id'])
-        recipe_user = UserRecipe.objects.filter(recipe=recipe,
-                                                user=self.request.user
-                                                ).first()
-        if recipe_user is None:
+        result = remove_recipes('shopping_cart', self.request.user,
+                                [recipe.id])
+        if result[recipe.id] != REMOVED:
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        recipe_user.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -161,13 +208,8 @@ class FavoriteViewSet(viewsets.ModelViewSet):
 
     def create(self, *args, **kwargs):
         recipe = get_object_or_404(Recipe, id=kwargs['recipes_id'])
-        favorite_obj = Favorite.objects.filter(
-            Q(recipe_id=recipe.id)
-            & Q(user_id=self.request.user.id)).exists()
-        if recipe is not None and not favorite_obj:
-            Favorite.objects.bulk_create([
-                Favorite(recipe=recipe, user=self.request.user)
-            ])
+        result = add_recipes('favorite', self.request.user, [recipe.id])
+        if result[recipe.id] == ADDED:
             serializer = FavoriteSerializer(recipe)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(status=status.HTTP_400_BAD_REQUEST)
@@ -178,12 +220,9 @@ class FavoriteViewSet(viewsets.ModelViewSet):
     )
     def delete(self, *args, **kwargs):
         recipe = get_object_or_404(Recipe, id=kwargs['recipes_id'])
-        favorite_obj = Favorite.objects.filter(
-            recipe=recipe,
-            user=self.request.user).first()
-        if favorite_obj is None:
+        result = remove_recipes('favorite', self.request.user, [recipe.id])
+        if result[recipe.id] != REMOVED:
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        favorite_obj.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -206,12 +245,12 @@ class SubscribeViewSet(viewsets.ModelViewSet):
                 subscribed_to=user,
                 user=self.request.user
             )
-            user_serializer = UserSerializer(user).data
-            user_serializer['is_subscribed'] = True
-            if 'recipes_limit' in self.request.GET:
-                user_serializer['limit'] = self.request.GET['recipes_limit']
-            serializer = SubscribeSerializer(user_serializer).data
-            return Response(serializer, status=status.HTTP_201_CREATED)
+            user.is_subscribed = True
+            serializer = SubscribeSerializer(
+                user,
+                context={'recipes_limit': get_recipes_limit(self.request),
+                         'request': self.request})
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
     @action(
@@ -229,47 +268,209 @@ class SubscribeViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     model = Recipe
     serializer_class = CreateRecipeSerializer
     pagination_class = CustomPagination
+    cursor_ordering = '-id'
+    personalized = True
     permission_classes = [IsAuthenticatedOrReadOnly, OwnerOrReadOnly]
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        queryset = super().get_queryset().order_by('-id')
+        if self.action not in ('retrieve', 'list', 'can_cook'):
+            return queryset
+        user = self.request.user
+        if self.action != 'can_cook' and self.use_cache():
+            user = None
+        fields = requested_fields(
+            self.request, self.get_serializer_class().Meta.fields)
+        return queryset.with_related(
+            user, fields, requested_expand(self.request)
+        ).with_user_flags(user, fields)
+
+    def use_cache(self):
+        params = self.request.query_params
+        return super().use_cache() and not (
+            self.request.user.is_authenticated
+            and (params.get('is_favorited')
+                 or params.get('is_in_shopping_cart')))
+
+    def get_cache_groups(self):
+        if self.action == 'retrieve':
+            return (recipe_group(self.kwargs['pk']),)
+        return (RECIPE_LIST,)
+
+    def get_cache_state(self):
+        """Состояние рецептов из базы, одинаковое для всех воркеров.
+
+        Для карточки это updated_at рецепта, для списка — наибольшие id
+        и updated_at: оба берутся из индекса, без COUNT(*). Правки тегов,
+        ингредиентов, авторов и счётчиков, а также удаление рецепта
+        сдвигают updated_at (см. signals.py).
+        """
+        if self.action == 'retrieve':
+            pk = str(self.kwargs['pk'])
+            state = {'updated': Recipe.objects.filter(
+                pk=pk).values_list('updated_at', flat=True).first()
+                if pk.isdigit() else None}
+        else:
+            state = Recipe.objects.aggregate(
+                last=Max('id'), updated=Max('updated_at'))
+        updated = state['updated']
+        return ({group: repr(sorted(state.items()))
+                 for group in self.get_cache_groups()},
+                updated.timestamp() if updated else None)
+
+    def use_validators(self):
+        return True
+
+    def personalize(self, data):
+        if self.action == 'retrieve':
+            overlay_user_flags([data], self.request.user)
+        else:
+            overlay_user_flags(data['results'], self.request.user)
+        return data
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
 
+    def perform_destroy(self, instance):
+        with saving_recipe(instance.id):
+            super().perform_destroy(instance)
+
     def get_serializer_class(self, action=None):
         if (action or self.action) in ('retrieve', 'list'):
             return GetRecipeSerializer
+        if (action or self.action) == 'can_cook':
+            return CanCookRecipeSerializer
         return CreateRecipeSerializer
 
+    @action(
+        detail=False,
+        url_path='can_cook',
+    )
+    def can_cook(self, request, *args, **kwargs):
+        ingredient_ids = set()
+        for value in request.query_params.getlist('ingredients'):
+            for item in value.split(','):
+                if not item.strip().isdigit():
+                    return Response(
+                        {'ingredients': f'Некорректный id: {item}'},
+                        status=status.HTTP_400_BAD_REQUEST)
+                ingredient_ids.add(int(item))
+        if not ingredient_ids:
+            return Response({'ingredients': 'Укажите ингредиенты.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.get_queryset().with_coverage(
+            ingredient_ids).order_by('missing', '-coverage', '-id')
+        max_missing = request.query_params.get('max_missing')
+        if max_missing is not None and max_missing.isdigit():
+            queryset = queryset.filter(missing__lte=int(max_missing))
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def change_user_list(self, list_name):
+        serializer = RecipeIdsSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if self.request.method == 'POST':
+            result = add_recipes(list_name, self.request.user, recipe_ids)
+        else:
+            result = remove_recipes(list_name, self.request.user, recipe_ids)
+        return Response({'results': [
+            {'id': recipe_id, 'status': item_status}
+            for recipe_id, item_status in result.items()
+        ]}, status=status.HTTP_200_OK)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite/batch',
+        permission_classes=[IsAuthenticated],
+    )
+    def favorite_batch(self, *args, **kwargs):
+        return self.change_user_list('favorite')
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_cart/batch',
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_batch(self, *args, **kwargs):
+        return self.change_user_list('shopping_cart')
+
+    @action(
+        detail=False,
+        url_path='export',
+        permission_classes=[IsAuthenticated],
+    )
+    def export(self, request, *args, **kwargs):
+        file_type = request.query_params.get('type', 'ndjson')
+        if file_type not in RECIPE_FORMATS:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        queryset = Recipe.objects.filter(author=request.user)
+        if request.query_params.get('since'):
+            since = parse_since(request.query_params['since'])
+            if since is None:
+                return Response({'since': 'Некорректная дата.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            queryset = queryset.filter(updated_at__gt=since)
+        _, render, content_type = RECIPE_FORMATS[file_type]
+        response = StreamingHttpResponse(render(export_rows(queryset)),
+                                         content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="recipes.{file_type}"')
+        return response
+
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='import',
+        permission_classes=[IsAuthenticated],
+    )
+    def import_recipes(self, request, *args, **kwargs):
+        file_type = request.query_params.get('type', 'ndjson')
+        if file_type not in RECIPE_FORMATS:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        read = RECIPE_FORMATS[file_type][0]
+        # Тело читается построчно, без загрузки целиком в request.data.
+        lines = (line.decode('utf-8') for line in request._request)
+        importer = RecipeImporter(request.user, api_image_loader)
+        response_status = status.HTTP_200_OK
+        try:
+            importer.run(read(lines))
+        except UnicodeDecodeError:
+            importer.errors.append(
+                (None, {'detail': 'Файл должен быть в кодировке UTF-8.'}))
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({
+            'created': importer.created,
+            'skipped': importer.skipped,
+            'errors': [{'line': number, 'errors': errors}
+                       for number, errors in importer.errors],
+        }, status=response_status)
+
     @action(
         detail=False,
         url_path='download_shopping_cart',
+        permission_classes=[IsAuthenticated],
     )
     def dowload(self, *args, **kwargs):
-        shopping_card = {}
-        ur_objects = UserRecipe.objects.filter(
-            user=self.request.user)
-        for obj in ur_objects:
-            ingredients = self.get_serializer(obj.recipe).data['ingredients']
-            for ing in ingredients:
-                if ing['id'] not in shopping_card:
-                    shopping_card[ing['id']] = {
-                        'name': ing['name'],
-                        'measurement_unit': ing['measurement_unit'],
-                        'amount': ing['amount'],
-                    }
-                else:
-                    shopping_card[ing['id']]['amount'] += ing['amount']
-        content = '\n'.join(f'{key}: {value}'
-                            for key, value in shopping_card.items())
-        response = HttpResponse(content, content_type='text/plain')
-        response['Content-Disposition'] = 'attachment; filename="file.txt"'
-
+        file_type = self.request.query_params.get('type', 'txt')
+        if file_type not in SHOPPING_LIST_FORMATS:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        renderer, content_type = SHOPPING_LIST_FORMATS[file_type]
+        response = StreamingHttpResponse(
+            renderer(get_shopping_list(self.request.user)),
+            content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{file_type}"')
         return response
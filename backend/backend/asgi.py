@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Горячие эндпоинты чтения обслуживаются async-вьюхами.
+os.environ.setdefault('ROOT_URLCONF', 'backend.asgi_urls')
 
 application = get_asgi_application()
@@ -0,0 +1,14 @@
+from django.urls import path
+
+from api.async_views import cached_read, short_link_redirect
+from api.views import IngredientsViewSet, RecipeViewSet
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/recipes/', cached_read(RecipeViewSet, 'list')),
+    path('api/recipes/<int:pk>/', cached_read(RecipeViewSet, 'retrieve')),
+    path('api/ingredients/', cached_read(IngredientsViewSet, 'list')),
+    path('s/<str:short_link>/', short_link_redirect),
+    *sync_urlpatterns,
+]
@@ -47,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.PerformanceMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,7 +58,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'backend.urls'
+ROOT_URLCONF = os.getenv('ROOT_URLCONF', 'backend.urls')
 
 TEMPLATES = [
     {
@@ -80,24 +82,95 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
-# DATABASES = {
-#     'default': {
-#         'ENGINE': 'django.db.backends.sqlite3',
-#         'NAME': BASE_DIR / 'db.sqlite3',
-#     }
-# }
+DB_ENGINE = os.getenv('DB_ENGINE', 'django.db.backends.postgresql')
+
+# Постоянные соединения: секунды жизни, 0 — новое на каждый запрос.
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+# Проверять переиспользуемое соединение перед запросом, если оно
+# простояло без дела дольше DB_CONN_HEALTH_CHECK_IDLE секунд.
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+DB_CONN_HEALTH_CHECK_IDLE = float(os.getenv('DB_CONN_HEALTH_CHECK_IDLE', 10))
+# Работа через pgbouncer в режиме transaction pooling.
+DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', 'False') == 'True'
+# Реплики для чтения: пути к файлам SQLite или host[:port] PostgreSQL.
+DB_REPLICAS = [
+    replica.strip()
+    for replica in os.getenv('DB_REPLICAS', '').split(',') if replica.strip()
+]
+
+
+def database(**options):
+    if DB_ENGINE == 'django.db.backends.sqlite3':
+        config = {'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3')}
+    else:
+        config = {
+            'NAME': os.getenv('POSTGRES_DB', 'django'),
+            'USER': os.getenv('POSTGRES_USER', 'django'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'db'),
+            'PORT': os.getenv('DB_PORT', 5432),
+            'DISABLE_SERVER_SIDE_CURSORS': DB_PGBOUNCER,
+        }
+    return {'ENGINE': DB_ENGINE, 'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            **config, **options}
+
+
+def replica(address):
+    if DB_ENGINE == 'django.db.backends.sqlite3':
+        return database(NAME=address, TEST={'MIRROR': 'default'})
+    host, _, port = address.partition(':')
+    return database(HOST=host, PORT=port or os.getenv('DB_PORT', 5432),
+                    TEST={'MIRROR': 'default'})
+
 
 DATABASES = {
+    'default': database(),
+    **{f'replica{number}': replica(address)
+       for number, address in enumerate(DB_REPLICAS, start=1)},
+}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+# После записи клиент читает из основной базы столько секунд.
+DB_REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', 5))
+# Реплика, отставшая больше чем на столько секунд, не используется.
+DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 5))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', 5))
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter'] if DB_REPLICAS else []
+
+# Cache
+# Для нескольких воркеров gunicorn используйте общий бэкенд, например
+# CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# и CACHE_LOCATION=/var/tmp/foodgram_cache.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('POSTGRES_DB', 'django'),
-        'USER': os.getenv('POSTGRES_USER', 'django'),
-        'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
-        'HOST': 'db',
-        'PORT': os.getenv('DB_PORT', 5432)
+        'BACKEND': os.getenv('CACHE_BACKEND',
+                             'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
     }
 }
 
+API_CACHE_ALIAS = 'default'
+API_CACHE_ENABLED = os.getenv('API_CACHE_ENABLED', 'True') == 'True'
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', 300))
+
+# Кэш коротких ссылок в памяти процесса.
+SHORT_LINK_CACHE_SIZE = int(os.getenv('SHORT_LINK_CACHE_SIZE', 10000))
+SHORT_LINK_CACHE_TTL = int(os.getenv('SHORT_LINK_CACHE_TTL', 3600))
+SHORT_LINK_PERMANENT_REDIRECT = os.getenv('SHORT_LINK_PERMANENT_REDIRECT',
+                                          'False') == 'True'
+
+# Server-Timing, гистограммы на /metrics/ и лог медленных запросов.
+PERFORMANCE_MONITORING = os.getenv('PERFORMANCE_MONITORING',
+                                   'False') == 'True'
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+
+# Автодополнение ингредиентов из каталога в памяти процесса.
+INGREDIENT_INDEX_ENABLED = os.getenv('INGREDIENT_INDEX_ENABLED',
+                                     'False') == 'True'
+
+# Потоки для нарезки превью картинок; 0 — обрабатывать в запросе.
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators